@@ -0,0 +1,180 @@
+"""Update and render benchmarks at several entity scales, checked against stored baselines.
+
+Runs under the SDL dummy video driver, so no window is opened. Each scenario
+fills the world to its entity counts, then times World.step and draw_world
+separately for a number of ticks, keeping the fastest of a few runs. Taking a
+snapshot of the world and restoring it are timed too. Exits non-zero when any median is more
+than --threshold slower than its baseline. Baselines are recorded with --save on the
+machine they are compared on, and are not shared between machines.
+
+Example:
+    python bench.py                  # compare against bench_baseline.json
+    python bench.py --save           # record new baselines on this machine
+    python bench.py --scenario 100x --ticks 1000
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import statistics
+
+# Benchmarks never open a window or play sound
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import game
+
+BASELINE_FILE = "bench_baseline.json"
+DEFAULT_THRESHOLD = 0.25  # Allowed slowdown over baseline before a scenario fails
+DEFAULT_REPEATS = 3  # Runs per scenario; the fastest is kept to filter out noise from other processes
+WARMUP_TICKS = 60  # Fills sprite caches and the particle/flame buffers before timing
+STEER_TICKS = 30  # Ticks between changes of direction, so the player keeps moving and shooting
+STEER_ORDER = (game.INPUT_RIGHT, game.INPUT_DOWN, game.INPUT_LEFT, game.INPUT_UP)
+
+# Entity counts each scenario is held at while it runs
+SCENARIOS = {
+    "baseline": {"stars": game.MAX_STARS, "obstacles": game.MAX_OBSTACLES},
+    "10x": {"stars": game.MAX_STARS * 10, "obstacles": game.MAX_OBSTACLES * 10},
+    "100x": {"stars": game.MAX_STARS * 100, "obstacles": game.MAX_OBSTACLES * 100},
+    "swarm": {"stars": game.MAX_STARS, "obstacles": game.HARD_MODE_MAX_OBSTACLES, "swarm": True},
+    # A burst every tick keeps the particle buffer at capacity
+    "particles": {"stars": game.MAX_STARS, "obstacles": game.MAX_OBSTACLES,
+                  "bursts": game.PARTICLE_CAPACITY // (game.PARTICLE_COUNT * game.PARTICLE_LIFE)},
+    # A trail ten times the usual length behind the player
+    "flame_trail": {"stars": game.MAX_STARS, "obstacles": game.MAX_OBSTACLES, "trail": 10},
+}
+
+def make_world(scenario, seed=0):
+    world = game.World(seed=seed, max_stars=scenario["stars"],
+                       max_obstacles=scenario["obstacles"], swarm=scenario.get("swarm", False))
+    trail = scenario.get("trail")
+    if trail:
+        world.player.flame_trail = game.FlameTrail(game.FLAME_TRAIL_CAPACITY * trail)
+    return world
+
+def top_up(world, scenario):
+    """Restore the scenario's workload after the last tick collected, shot or hit things"""
+    # The player is invulnerable so every tick does the same work
+    world.game_over = False
+    while len(world.stars) < world.max_stars:
+        world.spawn_star()
+    while len(world.obstacles) < world.max_obstacles:
+        world.spawn_obstacle()
+    for _ in range(scenario.get("bursts", 0)):
+        world.particles.emit(world.rng.uniform(0, game.WIDTH), world.rng.uniform(0, game.HEIGHT))
+    trail = scenario.get("trail")
+    if trail:
+        player = world.player
+        # Extra puffs further behind the player stretch the trail out
+        back_x, back_y = -math.cos(player.angle) * 8, -math.sin(player.angle) * 8
+        for i in range(3, 3 * trail):
+            player.flame_trail.add(player.x + back_x * (i + 1), player.y + back_y * (i + 1),
+                                   game.FLAME_LIFE - i % 3 * 4)
+
+def run_scenario(screen, hud, background, scenario, ticks, seed=0):
+    """Return per-phase lists of per-tick times in microseconds, and the largest snapshot in bytes"""
+    world = make_world(scenario, seed)
+    times = {"update": [], "render": [], "snapshot": [], "restore": []}
+    for tick in range(WARMUP_TICKS + ticks):
+        top_up(world, scenario)
+        inputs = STEER_ORDER[tick // STEER_TICKS % len(STEER_ORDER)]
+        start = time.perf_counter_ns()
+        world.step(inputs)
+        updated = time.perf_counter_ns()
+        game.draw_world(screen, world, hud, background=background)
+        rendered = time.perf_counter_ns()
+        if tick >= WARMUP_TICKS:
+            times["update"].append((updated - start) / 1000)
+            times["render"].append((rendered - updated) / 1000)
+
+    # Snapshots get a loop of their own, restored into a copy of the world, so restoring
+    # never churns the entities the update and render times are measured on
+    copy = game.World.from_snapshot(world.snapshot())
+    snapshot_bytes = 0
+    for tick in range(WARMUP_TICKS + ticks):
+        top_up(world, scenario)
+        world.step(STEER_ORDER[tick // STEER_TICKS % len(STEER_ORDER)])
+        start = time.perf_counter_ns()
+        snapshot = world.snapshot()
+        snapshotted = time.perf_counter_ns()
+        copy.restore(snapshot)
+        restored = time.perf_counter_ns()
+        if tick >= WARMUP_TICKS:
+            times["snapshot"].append((snapshotted - start) / 1000)
+            times["restore"].append((restored - snapshotted) / 1000)
+            snapshot_bytes = max(snapshot_bytes, sum(len(section) for section in snapshot))
+    return times, snapshot_bytes
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(times):
+    return {"median_us": statistics.median(times), "p95_us": percentile(times, 0.95)}
+
+def load_baselines(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update/render benchmarks")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument("--ticks", type=int, default=300, help="timed ticks per scenario")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEATS,
+                        help=f"runs per scenario, keeping the fastest (default {DEFAULT_REPEATS})")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed slowdown as a fraction (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--save", action="store_true",
+                        help="store these results as the new baselines instead of comparing")
+    args = parser.parse_args(argv)
+
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    hud = game.Hud(pygame.font.Font(None, 36), pygame.font.Font(None, 72))
+    background = game.Background()
+    baselines = load_baselines(args.baseline)
+    if not baselines and not args.save:
+        print(f"No baselines in {args.baseline} to compare with; "
+              "run python bench.py --save on the unchanged tree first")
+    results = {}
+    regressions = []
+
+    for name in args.scenario or SCENARIOS:
+        runs = [run_scenario(screen, hud, background, SCENARIOS[name], args.ticks) for _ in range(args.repeat)]
+        results[name] = {phase: min((summarize(times[phase]) for times, _ in runs),
+                                    key=lambda s: s["median_us"])
+                         for phase in runs[0][0]}
+        for phase, stats in results[name].items():
+            line = f"{name:>12} {phase:<6} median {stats['median_us']:9.1f}us  p95 {stats['p95_us']:9.1f}us"
+            baseline = baselines.get(name, {}).get(phase)
+            if baseline and not args.save:
+                change = stats["median_us"] / baseline["median_us"] - 1
+                line += f"  {change:+7.1%} vs baseline"
+                if change > args.threshold:
+                    line += "  REGRESSION"
+                    regressions.append(f"{name} {phase}")
+            print(line)
+        print(f"{name:>12} snapshot size {max(size for _, size in runs) / 1024:.1f} KiB")
+
+    if args.save:
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print(f"Saved baselines for {len(results)} scenarios to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,27 @@
 import pygame
+import numpy as np
 import random
 import math
 import os
-
-# Initialize Pygame
-pygame.init()
+import sys
+import csv
+import json
+import time
+import gc
+import zlib
+import shlex
+import struct
+import argparse
+import itertools
+import subprocess
+import threading
+import queue
+from collections import OrderedDict, deque
 
 # Constants
 WIDTH, HEIGHT = 800, 600
-FPS = 60
+FPS = 60  # Simulation ticks per second (and the default render cap)
+MAX_FRAME_TIME = 0.25  # Longest frame the simulation catches up on before slowing down
 
 # Colors - vibrant and playful palette
 BACKGROUND = (20, 25, 40)
@@ -33,51 +46,419 @@ PARTICLE_COLORS = [(255, 255, 0), (255, 200, 0), (255, 150, 0)]
 # Game settings
 PLAYER_SIZE = 30
 PLAYER_SPEED = 5
+SHOOT_COOLDOWN = 15  # Ticks between shots
 STAR_SIZE = 20
+STAR_SPIN = 5  # Degrees a star turns per tick
+STAR_PULSE_RATE = 0.2  # Radians of the star's size pulse per tick
 OBSTACLE_SIZE = 25
+COMET_SPIN = 3  # Degrees a comet turns per tick
 STAR_SPAWN_RATE = 0.02
 OBSTACLE_SPAWN_RATE = 0.01
+MAX_STARS = 10
+MAX_OBSTACLES = 5
+HARD_MODE_MAX_OBSTACLES = 300  # Comet swarm size in hard mode
+HARD_MODE_OBSTACLE_SPAWN_RATE = 0.5
+SWARM_SHAPE_VARIANTS = 16  # Swarm comets share this many shapes so their sprites can be shared
 PARTICLE_COUNT = 15
+PARTICLE_LIFE = 30
+PARTICLE_GRAVITY = 0.2
+PARTICLE_CAPACITY = 16384  # Oldest particles are recycled once this many are alive
+FLAME_LIFE = 25
+FLAME_TRAIL_CAPACITY = 96  # Enough for 3 flames per tick over a full FLAME_LIFE
 PROJECTILE_SPEED = 8
 PROJECTILE_SIZE = 5
 PROJECTILE_COLOR = (255, 255, 0)
+PROJECTILE_CAPACITY = 1024  # Shots fired while this many are in flight are dropped
+PROJECTILE_LIFE = 120  # Ticks before a shot fizzles out, if it hasn't left the screen
+# Shot broad phase: cells are keyed as column * GRID_STRIDE + row, and a shot is tested
+# against the comets in its own cell and the 8 around it
+GRID_MIN_PAIRS = 64  # Below this many shot-comet pairs every pair is swept without the grid
+GRID_STRIDE = 1 << 20
+GRID_NEIGHBORS = np.array([dx * GRID_STRIDE + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+# Sine/cosine lookup tables in half-degree steps, since comet vertices sit 22.5 degrees apart
+# and every rotation advances by a whole number of degrees
+TRIG_STEPS = 720
+COS_TABLE = [math.cos(i * math.pi / 360) for i in range(TRIG_STEPS)]
+SIN_TABLE = [math.sin(i * math.pi / 360) for i in range(TRIG_STEPS)]
+COMET_POINTS = 16
+MAX_CRATERS = 4
+
+# Sprite cache settings
+SPRITE_CACHE_BUDGET = 64 * 1024 * 1024  # Bytes of pixel data kept in the sprite cache
+PLAYER_SPRITE_SIZE = 100  # Square surface the astronaut (and jetpack flame) is rendered into
+STAR_SPRITE_SIZE = 52
+OBSTACLE_SPRITE_SIZE = 56
+SPRITE_COLORKEY = (255, 0, 255)  # Transparent color, not used by any entity
+
+# Render detail levels, full detail first, stepped through by the quality scaler:
+# (name, particles per burst, flame rings, draw 1 in N flame puffs, comet shading,
+#  crater rims, star outlines, degrees between cached comet/star rotations)
+QUALITY_LEVELS = [
+    ("high", PARTICLE_COUNT, 3, 1, True, True, True, 1),
+    ("medium", 10, 2, 1, True, False, True, 6),
+    ("low", 6, 1, 2, False, False, False, 12),
+    ("minimal", 3, 1, 3, False, False, False, 24),
+]
+QUALITY_WINDOW = 60  # Frames of work time averaged before the level may change
+QUALITY_STEP_DOWN = 0.9  # Fraction of the frame budget above which detail is lowered
+QUALITY_STEP_UP = 0.6  # Fraction of the frame budget below which detail is raised again
+
+# Background layers
+BACKGROUND_SEED = 2024  # The backdrop looks the same every session
+NEBULA_COLORS = [(70, 30, 110), (30, 60, 120), (100, 30, 80)]
+NEBULA_COUNT = 5
+FAR_STAR_COUNT = 120  # Faint stars baked into the static layer
+# Scrolling star layers, far to near: (drift in px per tick, shift per px of player movement,
+# star count, star radius, color)
+PARALLAX_LAYERS = [
+    (0.15, 0.02, 70, 1, (120, 130, 170)),
+    (0.4, 0.05, 35, 2, (190, 200, 235)),
+]
+
+# Frame profiler
+PROFILE_PHASES = ("events", "player", "projectiles", "spawn", "stars", "obstacles",
+                  "particles", "cleanup", "draw", "hud", "overlay", "flip", "capture")
+PROFILE_WINDOW = 600  # Frames kept for the rolling percentiles
+PROFILE_OVERLAY_REFRESH = 15  # Frames between overlay text updates
+
+# Frame capture
+CAPTURE_BUFFERS = 8  # Frames the writer may fall behind by before new frames are dropped
+CAPTURE_PNG_LEVEL = 1  # zlib level for PNG sequences; higher levels can't keep up at 60 fps
 
 # High score file
 HIGH_SCORE_FILE = "highscore.txt"
+LEADERBOARD_FILE = "leaderboard.log"  # Append-only log of finished games, compacted to the top scores
+LEADERBOARD_SIZE = 10
+LEADERBOARD_COMPACT_LINES = 100  # Rewrite the log once it grows to this many lines
 
-class Projectile:
-    def __init__(self, x, y, angle):
-        self.x = x
-        self.y = y
-        self.angle = angle
-        self.speed = PROJECTILE_SPEED
-        self.size = PROJECTILE_SIZE
-        self.color = PROJECTILE_COLOR
-        
+# Input bitmask flags passed to World.step()
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
+INPUT_RESTART = 16  # Restart after game over (the R key)
+
+# Replay files: header (magic, version, seed) followed by one input byte per tick
+REPLAY_MAGIC = b"SCRP"
+REPLAY_VERSION = 3  # Bumped whenever the simulation changes, since old inputs would desync
+REPLAY_HEADER = struct.Struct("<4sBQ")
+
+# Snapshots: a header section followed by the sections of World.snapshot()
+SNAPSHOT_MAGIC = b"SCSS"
+SNAPSHOT_VERSION = 3  # Bumped whenever the snapshot layout changes
+# Magic, version, process, seed, tick, score, high score, game over, swarm, max stars,
+# max obstacles, star and obstacle spawn rates, player speed, shoot cooldown; then the
+# player's x, y, last x, last y, angle, jetpack flame, shot cooldown and flame trail head;
+# then the Mersenne Twister index and gauss_next, the particle generator's PCG64 state and
+# the next shot serial; then the game number and the next star and comet serials
+SNAPSHOT_HEADER = struct.Struct("<4sBQQqqq??IIdddi6diII?d16s16s?IqIqq")
+SNAPSHOT_SECTIONS = 8  # Header, RNG words, flame trail, stars, comets, comet shapes, shots, particles
+MT_STATE_WORDS = 624  # 32-bit words in the Mersenne Twister state behind random.Random
+# Comet shape ids are sprite cache keys, so they are only reused by snapshots from this process
+SNAPSHOT_PROCESS = int.from_bytes(os.urandom(8), "little")
+# Shapes owned by single comets, in slot order; swarm comets share variants and need none
+COMET_SHAPE_STATE = np.dtype([("shape_id", "<i8"), ("variation", "<f8", (COMET_POINTS,)),
+                              ("craters", "<f8", (MAX_CRATERS, 3)), ("crater_count", "u1")])
+
+# Rewind and quick-save
+REWIND_SECONDS = 10  # History kept for rewinding
+REWIND_INTERVAL = 10  # Ticks between rewind snapshots; the ticks in between are replayed from inputs
+REWIND_SPEED = 2  # Ticks rewound per tick while the rewind key is held
+QUICKSAVE_FILE = "quicksave.snap"
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+def convert_surface(surface, alpha=False):
+    """Convert a surface to the display's pixel format for fast blits, once there is a display"""
+    if pygame.display.get_surface() is None:
+        return surface
+    return surface.convert_alpha() if alpha else surface.convert()
+
+class SpriteCache:
+    """LRU cache of pre-rendered entity surfaces bounded by a pixel memory budget"""
+    def __init__(self, budget=SPRITE_CACHE_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self._surfaces = OrderedDict()
+
+    def get(self, key, size, render):
+        """Return the cached surface for key, calling render(surface, cx, cy) on a miss"""
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = pygame.Surface((size, size))
+        surface.fill(SPRITE_COLORKEY)
+        render(surface, size // 2, size // 2)
+        surface = convert_surface(surface)
+        # Colorkeyed RLE surfaces blit much faster than per-pixel alpha
+        surface.set_colorkey(SPRITE_COLORKEY, pygame.RLEACCEL)
+        self._surfaces[key] = surface
+        self.used += size * size * surface.get_bytesize()
+        while self.used > self.budget and len(self._surfaces) > 1:
+            _, evicted = self._surfaces.popitem(last=False)
+            width, height = evicted.get_size()
+            self.used -= width * height * evicted.get_bytesize()
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+        self.used = 0
+
+    def __len__(self):
+        return len(self._surfaces)
+
+sprite_cache = SpriteCache()
+
+class Quality:
+    """Render detail settings read by the draw code, lowered and raised by QualityScaler"""
+    def __init__(self, level=0):
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = level
+        (self.name, self.particle_count, self.flame_rings, self.flame_stride, self.comet_shading,
+         self.crater_rims, self.star_outlines, self.rotation_step) = QUALITY_LEVELS[level]
+
+quality = Quality()
+
+class QualityScaler:
+    """Steps the render quality down when frames run over budget and back up with headroom
+    
+    Work time is measured from the start of a frame until the flip, so time
+    spent waiting on the frame cap or vsync doesn't count against the budget.
+    Samples are discarded after every change so each level gets a full
+    window before the next decision.
+    """
+    def __init__(self, budget_ms, window=QUALITY_WINDOW):
+        self.budget_ms = budget_ms
+        self.samples = deque(maxlen=window)
+
+    def record(self, work_ms):
+        """Add one frame's work time and return whether the quality level changed"""
+        samples = self.samples
+        samples.append(work_ms)
+        if len(samples) < samples.maxlen:
+            return False
+        average = sum(samples) / len(samples)
+        if average > self.budget_ms * QUALITY_STEP_DOWN and quality.level < len(QUALITY_LEVELS) - 1:
+            quality.set_level(quality.level + 1)
+        elif average < self.budget_ms * QUALITY_STEP_UP and quality.level > 0:
+            quality.set_level(quality.level - 1)
+        else:
+            return False
+        samples.clear()
+        return True
+
+class Pool:
+    """Free list of reusable instances, such as comet shapes; they reinitialize in reset()"""
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+        self.allocations = 0  # Instances constructed because the free list was empty
+    
+    def acquire(self, *args):
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args)
+            return obj
+        self.allocations += 1
+        return self.cls(*args)
+    
+    def take(self):
+        """Return an instance without resetting it, for callers that set every field themselves"""
+        if self.free:
+            return self.free.pop()
+        self.allocations += 1
+        return self.cls()
+    
+    def release(self, obj):
+        self.free.append(obj)
+
+class ComponentStore:
+    """Struct-of-arrays entity storage with one NumPy column per component field
+    
+    Entities occupy slots [0, count) and systems process whole columns in one
+    pass. kill() only marks a slot; compact() drops every marked slot at once
+    at the end of the tick, keeping the survivors in their original order.
+    len() includes entities killed this tick until they are compacted away.
+    """
+    def __init__(self, capacity, **fields):
+        self.capacity = capacity
+        self.count = 0
+        self.dead = np.zeros(capacity, dtype=bool)
+        self.fields = {}  # Field name -> column, also reachable as an attribute
+        for name, dtype in fields.items():
+            column = np.zeros(capacity, dtype=dtype)
+            self.fields[name] = column
+            setattr(self, name, column)
+    
+    def spawn(self, **values):
+        """Add an entity with the given field values and return its slot"""
+        if self.count == self.capacity:
+            raise ValueError("component store is full")
+        i = self.count
+        for name, value in values.items():
+            self.fields[name][i] = value
+        self.dead[i] = False
+        self.count += 1
+        return i
+    
+    def kill(self, i):
+        self.dead[i] = True
+    
+    def alive(self):
+        """Slots of the entities that have not been killed"""
+        return np.flatnonzero(~self.dead[:self.count])
+    
+    def compact(self):
+        """Remove every killed entity and return the surviving slots, or None if none died"""
+        n = self.count
+        dead = self.dead[:n]
+        if n == 0 or not np.count_nonzero(dead):
+            return None
+        keep = np.flatnonzero(~dead)
+        for column in self.fields.values():
+            column[:len(keep)] = column[keep]
+        dead[:] = False
+        self.count = len(keep)
+        return keep
+    
+    def clear(self):
+        self.dead[:self.count] = False
+        self.count = 0
+    
+    def state(self):
+        """Pack every slot's fields, one column after another, as bytes for load_state()"""
+        return b"".join(column[:self.count].tobytes() for column in self.fields.values())
+    
+    def state_count(self, data):
+        """Return how many entities load_state(data) would hold, or raise ValueError if it can't"""
+        row = sum(column.itemsize for column in self.fields.values())
+        count, rest = divmod(len(data), row)
+        if rest:
+            raise ValueError("component state is not a whole number of rows")
+        if count > self.capacity:
+            raise ValueError("component store is full")
+        return count
+    
+    def load_state(self, data):
+        count = self.state_count(data)
+        offset = 0
+        for column in self.fields.values():
+            column[:count] = np.frombuffer(data, column.dtype, count, offset)
+            offset += count * column.itemsize
+        self.dead[:max(count, self.count)] = False
+        self.count = count
+    
+    def __len__(self):
+        return self.count
+
+class FlameTrail:
+    """Ring buffer of jetpack flame puffs with array-wide life decay"""
+    _sprites = {}  # (life, rings) -> pre-rendered flame surface
+    
+    def __init__(self, capacity=FLAME_TRAIL_CAPACITY):
+        self.capacity = capacity
+        self.x = np.zeros(capacity, dtype=np.float64)
+        self.y = np.zeros(capacity, dtype=np.float64)
+        self.life = np.zeros(capacity, dtype=np.int16)
+        self.head = 0  # Next slot to write, which is also the oldest entry
+    
+    def add(self, x, y, life):
+        head = self.head
+        self.x[head] = x
+        self.y[head] = y
+        self.life[head] = life
+        self.head = (head + 1) % self.capacity
+    
     def update(self):
-        self.x += self.speed * math.cos(self.angle)
-        self.y += self.speed * math.sin(self.angle)
+        np.maximum(self.life - 1, 0, out=self.life)
     
-    def draw(self, screen):
-        pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.size)
-        pygame.draw.circle(screen, (255, 255, 255), (int(self.x), int(self.y)), self.size, 1)
+    def clear(self):
+        self.life[:] = 0
+        self.head = 0
     
-    def is_off_screen(self):
-        return (self.x < 0 or self.x > WIDTH or self.y < 0 or self.y > HEIGHT)
+    def state(self):
+        return self.x.tobytes() + self.y.tobytes() + self.life.tobytes()
     
-    def get_rect(self):
-        return pygame.Rect(self.x - self.size, self.y - self.size, 
-                          self.size * 2, self.size * 2)
+    @classmethod
+    def from_state(cls, data, head):
+        n, rest = divmod(len(data), 18)  # Two float64 coordinates and an int16 life per puff
+        if rest or not 0 <= head < n:
+            raise ValueError("flame trail state does not fit the trail")
+        trail = cls(n)
+        trail.x[:] = np.frombuffer(data, np.float64, n)
+        trail.y[:] = np.frombuffer(data, np.float64, n, n * 8)
+        trail.life[:] = np.frombuffer(data, np.int16, n, n * 16)
+        trail.head = head
+        return trail
+    
+    @classmethod
+    def sprite(cls, life, rings=3):
+        sprite = cls._sprites.get((life, rings))
+        if sprite is None:
+            life_ratio = life / FLAME_LIFE
+            # Yellow and orange flames
+            flame_colors = [
+                (255, int(200 * life_ratio), int(100 * life_ratio)),  # Orange
+                (255, int(255 * life_ratio), int(150 * life_ratio)),  # Yellow-orange
+                (255, int(255 * life_ratio), int(200 * life_ratio)),  # Yellow
+            ]
+            flame_size = int(6 + 4 * life_ratio)
+            half = flame_size + 1
+            sprite = pygame.Surface((half * 2, half * 2))
+            sprite.fill(SPRITE_COLORKEY)
+            # Lower quality levels keep only the outer rings
+            for i, color in enumerate(flame_colors[:rings]):
+                size_offset = i * 1.5
+                pygame.draw.circle(sprite, color, (half, half), int(flame_size - size_offset))
+            sprite.set_colorkey(SPRITE_COLORKEY, pygame.RLEACCEL)
+            cls._sprites[(life, rings)] = sprite
+        return sprite
+    
+    def draw(self, screen):
+        """Draw the trail and return the screen area it covers"""
+        # Oldest first so newer puffs are drawn on top
+        order = np.roll(np.arange(self.capacity), -self.head)
+        order = order[self.life[order] > 0]
+        stride = quality.flame_stride
+        if stride > 1:
+            # Thin the trail out, always keeping the newest puff
+            order = order[(order.size - 1) % stride::stride]
+        if order.size == 0:
+            return pygame.Rect(0, 0, 0, 0)
+        xs = self.x[order].astype(np.int32).tolist()
+        ys = self.y[order].astype(np.int32).tolist()
+        lives = self.life[order].tolist()
+        rings = quality.flame_rings
+        blits = []
+        for x, y, life in zip(xs, ys, lives):
+            sprite = self.sprite(life, rings)
+            half = sprite.get_width() // 2
+            blits.append((sprite, (x - half, y - half)))
+        rects = screen.blits(blits)
+        return rects[0].unionall(rects)
+    
+    def __len__(self):
+        return int(np.count_nonzero(self.life))
 
 class Player:
-    def __init__(self, x, y):
+    def __init__(self, x, y, speed=PLAYER_SPEED, cooldown=SHOOT_COOLDOWN):
         self.x = x
         self.y = y
         self.size = PLAYER_SIZE
-        self.speed = PLAYER_SPEED
+        self.speed = speed
+        self.cooldown = cooldown
         self.color = PLAYER_COLOR
         self.jetpack_flame = 0
-        self.flame_trail = []  # List of (x, y, life) tuples for flame trail
+        self.flame_trail = FlameTrail()
         self.last_x = x
         self.last_y = y
         self.angle = 0  # Direction player is facing (in radians, 0 = right)
@@ -128,12 +509,9 @@ class Player:
                 # Position flames behind the player (opposite of movement direction)
                 offset_x = -dir_x * (i + 1) * 8
                 offset_y = -dir_y * (i + 1) * 8
-                self.flame_trail.append({
-                    'x': self.x + offset_x,
-                    'y': self.y + offset_y,  # Position behind player
-                    'life': 25 - i * 4,  # Different life for each particle
-                    'max_life': 25
-                })
+                self.flame_trail.add(self.x + offset_x,
+                                     self.y + offset_y,  # Position behind player
+                                     FLAME_LIFE - i * 4)  # Different life for each particle
         else:
             self.jetpack_flame += 0.1
         
@@ -141,24 +519,20 @@ class Player:
         self.y = max(self.size, min(HEIGHT - self.size, self.y + dy))
         
         # Update flame trail
-        for flame in self.flame_trail[:]:
-            flame['life'] -= 1
-            if flame['life'] <= 0:
-                self.flame_trail.remove(flame)
+        self.flame_trail.update()
         
         # Update shoot cooldown
         if self.shoot_cooldown > 0:
             self.shoot_cooldown -= 1
     
-    def shoot(self):
-        """Create a projectile in the direction the player is facing"""
+    def shoot(self, projectiles):
+        """Fire a projectile in the direction the player is facing, if the cooldown allows"""
         if self.shoot_cooldown <= 0:
-            self.shoot_cooldown = 15  # Cooldown between shots (slightly slower)
+            self.shoot_cooldown = self.cooldown  # Cooldown between shots (slightly slower)
             # Projectile starts from the front of the player (head)
             start_x = self.x + math.cos(self.angle) * 20
             start_y = self.y + math.sin(self.angle) * 20
-            return Projectile(start_x, start_y, self.angle)
-        return None
+            projectiles.spawn(start_x, start_y, self.angle)
     
     def rotate_point(self, px, py, cx, cy, angle):
         """Rotate a point around a center point by an angle"""
@@ -168,8 +542,23 @@ class Player:
         dy = py - cy
         return (cx + dx * cos_a - dy * sin_a, cy + dx * sin_a + dy * cos_a)
     
-    def draw(self, screen):
-        x, y = int(self.x), int(self.y)
+    def draw(self, screen, alpha=1.0):
+        # Draw flame trail (behind the player)
+        trail_rect = self.flame_trail.draw(screen)
+        
+        # The astronaut only varies by facing angle and jetpack flame size
+        flame_size = int(8 + math.sin(self.jetpack_flame) * 4)
+        key = ('player', self.angle, flame_size)
+        sprite = sprite_cache.get(key, PLAYER_SPRITE_SIZE,
+                                  lambda surface, cx, cy: self.render(surface, cx, cy, flame_size))
+        half = PLAYER_SPRITE_SIZE // 2
+        x = int(lerp(self.last_x, self.x, alpha))
+        y = int(lerp(self.last_y, self.y, alpha))
+        rect = screen.blit(sprite, (x - half, y - half))
+        return rect.union(trail_rect) if trail_rect else rect
+    
+    def render(self, screen, x, y, flame_size):
+        """Draw the astronaut centered at (x, y) without the flame trail"""
         # Add π/2 offset so that when angle is 0° (right), the head (which is at -15y by default) points right
         # This aligns the sprite's default "up" orientation with the movement direction
         draw_angle = self.angle + math.pi / 2
@@ -180,24 +569,7 @@ class Player:
         def rot(px, py):
             return (x + px * cos_a - py * sin_a, y + px * sin_a + py * cos_a)
         
-        # Draw flame trail (behind the player)
-        for flame in self.flame_trail:
-            life_ratio = flame['life'] / flame['max_life']
-            # Yellow and orange flames
-            flame_colors = [
-                (255, int(200 * life_ratio), int(100 * life_ratio)),  # Orange
-                (255, int(255 * life_ratio), int(150 * life_ratio)),  # Yellow-orange
-                (255, int(255 * life_ratio), int(200 * life_ratio)),  # Yellow
-            ]
-            flame_size = int(6 + 4 * life_ratio)
-            for i, color in enumerate(flame_colors):
-                size_offset = i * 1.5
-                pygame.draw.circle(screen, color, 
-                                  (int(flame['x']), int(flame['y'])), 
-                                  int(flame_size - size_offset))
-        
         # Draw jetpack flames (behind player, opposite of facing direction)
-        flame_size = int(8 + math.sin(self.jetpack_flame) * 4)
         flame_colors = [(255, 100, 0), (255, 200, 0), (255, 255, 100)]
         flame_x, flame_y = rot(-10, 8)  # Behind and below player
         for i, color in enumerate(flame_colors):
@@ -289,118 +661,213 @@ class Player:
         return pygame.Rect(self.x - body_width // 2, self.y - 5, 
                           body_width, body_height)
 
-class Star:
-    def __init__(self):
-        self.x = random.randint(STAR_SIZE, WIDTH - STAR_SIZE)
-        self.y = random.randint(STAR_SIZE, HEIGHT - STAR_SIZE)
-        self.size = STAR_SIZE
-        self.color = random.choice(STAR_COLORS)
-        self.rotation = 0
-        self.pulse = 0
-        
-    def update(self):
-        self.rotation += 5
-        self.pulse += 0.2
-        
-    def draw(self, screen):
-        # Draw a star shape
-        size = self.size + int(math.sin(self.pulse) * 3)
-        points = []
-        center_x, center_y = int(self.x), int(self.y)
-        
-        for i in range(10):
-            angle = (self.rotation + i * 36) * math.pi / 180
-            if i % 2 == 0:
-                radius = size
-            else:
-                radius = size // 2
-            x = center_x + radius * math.cos(angle)
-            y = center_y + radius * math.sin(angle)
-            points.append((x, y))
-        
-        pygame.draw.polygon(screen, self.color, points)
+def draw_star(screen, x, y, color, rotation, pulse):
+    """Blit a star centered at (x, y) and return the rect it covers; color indexes STAR_COLORS"""
+    # The star has five-fold symmetry, so rotations repeat every 72 degrees
+    size = STAR_SIZE + int(math.sin(pulse) * 3)
+    rotation %= 72
+    rotation -= rotation % quality.rotation_step
+    outlined = quality.star_outlines
+    key = ('star', rotation, size, color, outlined)
+    sprite = sprite_cache.get(key, STAR_SPRITE_SIZE,
+                              lambda surface, cx, cy: render_star(surface, cx, cy, rotation, size,
+                                                                  STAR_COLORS[color], outlined))
+    half = STAR_SPRITE_SIZE // 2
+    return screen.blit(sprite, (int(x) - half, int(y) - half))
+
+def render_star(screen, center_x, center_y, rotation, size, color, outlined=True):
+    """Draw a star shape centered at (center_x, center_y)"""
+    points = []
+    
+    for i in range(10):
+        angle = (rotation + i * 36) * 2 % TRIG_STEPS
+        if i % 2 == 0:
+            radius = size
+        else:
+            radius = size // 2
+        x = center_x + radius * COS_TABLE[angle]
+        y = center_y + radius * SIN_TABLE[angle]
+        points.append((x, y))
+    
+    pygame.draw.polygon(screen, color, points)
+    if outlined:
         pygame.draw.polygon(screen, (255, 255, 255), points, 2)
+
+class StarField:
+    """Stars as component arrays: position, renderable (color and spawn tick) and serial
     
-    def get_rect(self):
-        return pygame.Rect(self.x - self.size, self.y - self.size, 
-                          self.size * 2, self.size * 2)
+    Stars never change once spawned: their spin and pulse follow from their
+    age when drawn, and the player is tested against every hitbox with one
+    vectorized rect check. Collected stars are killed and dropped together
+    by compact() at the end of the tick.
+    """
+    def __init__(self, capacity=MAX_STARS):
+        self.store = ComponentStore(capacity, x=np.int32, y=np.int32, color=np.uint8,
+                                    born=np.int64,
+                                    serial=np.int64)  # Unique per star, so spectators can follow it
+        self.next_serial = 0
+    
+    def spawn(self, x, y, color, tick):
+        self.store.spawn(x=x, y=y, color=color, born=tick, serial=self.next_serial)
+        self.next_serial += 1
+    
+    def colliding(self, rect):
+        """Return the live slots whose star hitbox overlaps rect, in spawn order"""
+        store = self.store
+        n = store.count
+        x, y = store.x[:n], store.y[:n]
+        # The hitbox reaches STAR_SIZE from the center, so test the centers against rect grown by that
+        hit = ((x > rect.left - STAR_SIZE) & (x < rect.right + STAR_SIZE)
+               & (y > rect.top - STAR_SIZE) & (y < rect.bottom + STAR_SIZE))
+        hit &= ~store.dead[:n]
+        return hit.nonzero()[0]
+    
+    def positions(self):
+        """Return the x and y arrays of every star, indexed by slot"""
+        n = self.store.count
+        return self.store.x[:n], self.store.y[:n]
+    
+    def kill(self, i):
+        """Mark the star in slot i for removal at the end of the tick and return its position"""
+        self.store.kill(i)
+        return int(self.store.x[i]), int(self.store.y[i])
+    
+    def compact(self):
+        self.store.compact()
+    
+    def clear(self):
+        self.store.clear()
+    
+    def draw(self, screen, tick):
+        """Draw every star as it looks at tick and return the rects they cover"""
+        store = self.store
+        n = store.count
+        return [draw_star(screen, x, y, color, age * STAR_SPIN, age * STAR_PULSE_RATE)
+                for x, y, color, age in zip(store.x[:n].tolist(), store.y[:n].tolist(),
+                                            store.color[:n].tolist(), (tick - store.born[:n]).tolist())]
+    
+    def __len__(self):
+        return len(self.store)
 
-class Obstacle:
-    def __init__(self):
-        self.x = random.randint(OBSTACLE_SIZE, WIDTH - OBSTACLE_SIZE)
-        self.y = random.randint(OBSTACLE_SIZE, HEIGHT - OBSTACLE_SIZE)
+class CometShape:
+    """Outline and craters of a comet, with the sprites and collider radius that follow from them
+    
+    Comets refer to their shape by shape_id, which is also the sprite cache
+    key. Each comet in a normal game owns a shape of its own, while swarm
+    comets share one of SWARM_SHAPE_VARIANTS shapes with negative ids.
+    """
+    __slots__ = ('shape_id', 'size', 'shape_points', 'craters', 'geometry', 'radius')
+    _shape_ids = itertools.count()
+    _variants = {}  # Shape variant -> CometShape shared by the swarm comets using it
+    
+    def __init__(self, rng=random):
         self.size = OBSTACLE_SIZE
-        self.rotation = 0
-        self.speed = random.uniform(1, 3)
-        self.angle = random.uniform(0, 2 * math.pi)
-        # Generate random shape points for comet (more circular)
         self.shape_points = []
-        num_points = 16  # More points for smoother circle
-        for i in range(num_points):
-            angle = (i * 360 / num_points) * math.pi / 180
-            # Less randomness for more circular shape
-            radius_variation = random.uniform(0.90, 1.0)  # Very small variation
-            self.shape_points.append((angle, radius_variation))
-        # Generate random crater positions
         self.craters = []
-        num_craters = random.randint(2, 4)
+        self.geometry = {}  # rotation -> (outline, shadow, highlight) offsets from the center
+        self.reset(rng)
+    
+    def reset(self, rng=random):
+        self.shape_id = next(CometShape._shape_ids)
+        self._generate_shape(rng)
+    
+    @classmethod
+    def variant(cls, variant):
+        """Return the shared shape for a variant in [0, SWARM_SHAPE_VARIANTS)"""
+        shape = cls._variants.get(variant)
+        if shape is None:
+            shape = cls._variants[variant] = cls(random.Random(variant))
+            shape.shape_id = -1 - variant
+        return shape
+    
+    def _generate_shape(self, rng):
+        # Generate random shape points for comet (more circular)
+        num_points = COMET_POINTS  # More points for smoother circle
+        # Less randomness for more circular shape
+        variations = [rng.uniform(0.90, 1.0) for _ in range(num_points)]  # Very small variation
+        # Generate random crater positions as (x, y, size) relative to the comet size
+        craters = []
+        num_craters = rng.randint(2, MAX_CRATERS)
         for _ in range(num_craters):
-            self.craters.append({
-                'x': random.uniform(-0.6, 0.6),
-                'y': random.uniform(-0.6, 0.6),
-                'size': random.uniform(0.15, 0.3)
-            })
-        
-    def update(self):
-        self.rotation += 3
-        self.x += self.speed * math.cos(self.angle)
-        self.y += self.speed * math.sin(self.angle)
+            craters.append((
+                rng.uniform(-0.6, 0.6),
+                rng.uniform(-0.6, 0.6),
+                rng.uniform(0.15, 0.3)
+            ))
+        self._set_shape(variations, craters)
+    
+    def _set_shape(self, variations, craters):
+        # A new geometry cache, since a shape taken from the pool may have been drawn before
+        self.geometry = {}
+        num_points = len(variations)
+        self.shape_points = [((i * 360 / num_points) * math.pi / 180, radius_variation)
+                             for i, radius_variation in enumerate(variations)]
+        # Projectiles collide with the circle that best fits the outline
+        self.radius = self.size * sum(var for _, var in self.shape_points) / num_points
+        self.craters = list(craters)
+    
+    def restore(self, shape_id, variations, craters):
+        """Put the shape back in a state captured by World.snapshot()"""
+        self.shape_id = shape_id
+        self._set_shape(variations, craters)
+    
+    def draw(self, screen, x, y, rotation):
+        """Blit the comet centered at (x, y) turned by rotation degrees and return its rect"""
+        rotation %= 360
+        rotation -= rotation % quality.rotation_step
+        key = ('comet', self.shape_id, rotation, quality.comet_shading, quality.crater_rims)
+        sprite = sprite_cache.get(key, OBSTACLE_SPRITE_SIZE,
+                                  lambda surface, cx, cy: self.render(surface, cx, cy, rotation,
+                                                                      quality.comet_shading,
+                                                                      quality.crater_rims))
+        half = OBSTACLE_SPRITE_SIZE // 2
+        return screen.blit(sprite, (int(x) - half, int(y) - half))
+    
+    def outline(self, rotation):
+        """Return the (outline, shadow, highlight) vertex offsets for a rotation in degrees"""
+        geometry = self.geometry.get(rotation)
+        if geometry is not None:
+            return geometry
+        outline = []
+        step = TRIG_STEPS // COMET_POINTS
+        for i, (_, radius_var) in enumerate(self.shape_points):
+            angle = (i * step + rotation * 2) % TRIG_STEPS
+            radius = self.size * radius_var
+            outline.append((radius * COS_TABLE[angle], radius * SIN_TABLE[angle]))
         
-        # Bounce off walls
-        if self.x <= OBSTACLE_SIZE or self.x >= WIDTH - OBSTACLE_SIZE:
-            self.angle = math.pi - self.angle
-        if self.y <= OBSTACLE_SIZE or self.y >= HEIGHT - OBSTACLE_SIZE:
-            self.angle = -self.angle
-            
-        self.x = max(OBSTACLE_SIZE, min(WIDTH - OBSTACLE_SIZE, self.x))
-        self.y = max(OBSTACLE_SIZE, min(HEIGHT - OBSTACLE_SIZE, self.y))
+        # The light sits up and to the left of the center (from top-left),
+        # so which vertices are shaded only depends on their offsets
+        light_offset = self.size * 0.3
+        shadow = []
+        highlight = []
+        for ox, oy in outline:
+            # Calculate distance from light source
+            dx_light = ox + light_offset
+            dy_light = oy + light_offset
+            # Points further from light are darker
+            if dx_light*dx_light + dy_light*dy_light > (self.size * 0.8) ** 2:
+                shadow.append((ox, oy))
+            else:
+                highlight.append((ox, oy))
+        geometry = self.geometry[rotation] = (outline, shadow, highlight)
+        return geometry
     
-    def draw(self, screen):
-        center_x, center_y = int(self.x), int(self.y)
+    def render(self, screen, center_x, center_y, rotation, shading=True, crater_rims=True):
+        """Draw the comet centered at (center_x, center_y)"""
+        outline, shadow, highlight = self.outline(rotation)
         
         # Draw the comet body with irregular shape
-        outer_points = []
-        
-        for angle_offset, radius_var in self.shape_points:
-            angle = angle_offset + self.rotation * math.pi / 180
-            radius = self.size * radius_var
-            outer_points.append((
-                center_x + radius * math.cos(angle),
-                center_y + radius * math.sin(angle)
-            ))
+        outer_points = [(center_x + ox, center_y + oy) for ox, oy in outline]
         
         # Draw base comet shape
         if len(outer_points) > 2:
             pygame.draw.polygon(screen, COMET_BASE_COLOR, outer_points)
         
-        # Draw shading based on light direction (from top-left)
-        light_x = center_x - self.size * 0.3
-        light_y = center_y - self.size * 0.3
-        
         # Draw shadow side (darker purple on the right/bottom)
-        shadow_points = []
-        highlight_points = []
-        for px, py in outer_points:
-            # Calculate distance from light source
-            dx_light = px - light_x
-            dy_light = py - light_y
-            dist_from_light = math.sqrt(dx_light*dx_light + dy_light*dy_light)
-            
-            # Points further from light are darker
-            if dist_from_light > self.size * 0.8:
-                shadow_points.append((px, py))
-            else:
-                highlight_points.append((px, py))
+        if not shading:
+            shadow = highlight = ()
+        shadow_points = [(center_x + ox, center_y + oy) for ox, oy in shadow]
+        highlight_points = [(center_x + ox, center_y + oy) for ox, oy in highlight]
         
         # Draw shadow regions
         if len(shadow_points) >= 2:
@@ -419,26 +886,28 @@ class Obstacle:
                 pygame.draw.polygon(screen, COMET_LIGHT, highlight_poly)
         
         # Add a bright highlight spot on the light side
-        highlight_spot_x = center_x - self.size * 0.4
-        highlight_spot_y = center_y - self.size * 0.4
-        pygame.draw.circle(screen, (220, 100, 220), 
-                         (int(highlight_spot_x), int(highlight_spot_y)), 
-                         int(self.size * 0.3))
+        if shading:
+            highlight_spot_x = center_x - self.size * 0.4
+            highlight_spot_y = center_y - self.size * 0.4
+            pygame.draw.circle(screen, (220, 100, 220), 
+                             (int(highlight_spot_x), int(highlight_spot_y)), 
+                             int(self.size * 0.3))
         
         # Draw craters (dark holes)
-        for crater in self.craters:
-            crater_x = center_x + crater['x'] * self.size
-            crater_y = center_y + crater['y'] * self.size
-            crater_size = self.size * crater['size']
+        for crater_offset_x, crater_offset_y, crater_scale in self.craters:
+            crater_x = center_x + crater_offset_x * self.size
+            crater_y = center_y + crater_offset_y * self.size
+            crater_size = self.size * crater_scale
             
             # Draw crater shadow (dark center)
             pygame.draw.circle(screen, CRATER_COLOR, 
                              (int(crater_x), int(crater_y)), 
                              int(crater_size))
             # Draw crater rim (slightly lighter)
-            pygame.draw.circle(screen, COMET_DARK, 
-                             (int(crater_x), int(crater_y)), 
-                             int(crater_size), 1)
+            if crater_rims:
+                pygame.draw.circle(screen, COMET_DARK, 
+                                 (int(crater_x), int(crater_y)), 
+                                 int(crater_size), 1)
             # Draw inner shadow
             pygame.draw.circle(screen, (40, 0, 40), 
                              (int(crater_x), int(crater_y)), 
@@ -448,33 +917,438 @@ class Obstacle:
         if len(outer_points) > 2:
             pygame.draw.polygon(screen, (100, 0, 100), outer_points, 2)
     
-    def get_rect(self):
-        return pygame.Rect(self.x - self.size, self.y - self.size, 
-                          self.size * 2, self.size * 2)
 
-class Particle:
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-        self.vx = random.uniform(-3, 3)
-        self.vy = random.uniform(-3, 3)
-        self.color = random.choice(PARTICLE_COLORS)
-        self.life = 30
-        self.size = random.randint(3, 6)
-        
+class CometField:
+    """Comets as component arrays: position, velocity, rotation, collider radius and shape
+    
+    update() advances every comet in one vectorized step. The shape column is
+    the renderable component, holding the id of the comet's CometShape in
+    shapes. Shot comets are killed and dropped together by compact() at the
+    end of the tick, which also returns the shapes they owned to the pool.
+    """
+    def __init__(self, capacity=MAX_OBSTACLES):
+        self.store = ComponentStore(capacity, x=np.float64, y=np.float64,
+                                    prev_x=np.float64, prev_y=np.float64,
+                                    vx=np.float64, vy=np.float64, rotation=np.int64,
+                                    radius=np.float64, shape=np.int64,
+                                    serial=np.int64)  # Unique per comet, so spectators can follow it
+        self.shapes = {}  # Shape id -> CometShape, for every shape in the shape column
+        self.next_serial = 0
+    
+    def spawn(self, x, y, vx, vy, shape):
+        store = self.store
+        if store.count == store.capacity:
+            self.compact()  # Make room by dropping comets already shot this tick
+        store.spawn(x=x, y=y, prev_x=x, prev_y=y, vx=vx, vy=vy, rotation=0, radius=shape.radius,
+                    shape=shape.shape_id, serial=self.next_serial)
+        self.shapes[shape.shape_id] = shape
+        self.next_serial += 1
+    
     def update(self):
-        self.x += self.vx
-        self.y += self.vy
-        self.life -= 1
-        self.vy += 0.2  # Gravity
+        store = self.store
+        n = store.count
+        x, y, vx, vy = store.x[:n], store.y[:n], store.vx[:n], store.vy[:n]
+        store.prev_x[:n] = x
+        store.prev_y[:n] = y
+        store.rotation[:n] += COMET_SPIN
+        x += vx
+        y += vy
         
+        # Bounce off walls
+        np.negative(vx, out=vx, where=(x <= OBSTACLE_SIZE) | (x >= WIDTH - OBSTACLE_SIZE))
+        np.negative(vy, out=vy, where=(y <= OBSTACLE_SIZE) | (y >= HEIGHT - OBSTACLE_SIZE))
+        
+        # Clamped with the ufuncs directly, which cost less than np.clip on a handful of comets
+        np.minimum(np.maximum(x, OBSTACLE_SIZE, out=x), WIDTH - OBSTACLE_SIZE, out=x)
+        np.minimum(np.maximum(y, OBSTACLE_SIZE, out=y), HEIGHT - OBSTACLE_SIZE, out=y)
+    
+    def colliding(self, rect):
+        """Return the live slots whose comet hitbox overlaps rect"""
+        store = self.store
+        n = store.count
+        x, y = store.x[:n], store.y[:n]
+        # The hitbox corner is truncated like the pygame.Rect constructor does. Comets never go
+        # above or left of OBSTACLE_SIZE, so that is a floor, which the bounds below fold in
+        hit = ((x >= rect.left - OBSTACLE_SIZE + 1) & (x < rect.right + OBSTACLE_SIZE)
+               & (y >= rect.top - OBSTACLE_SIZE + 1) & (y < rect.bottom + OBSTACLE_SIZE))
+        hit &= ~store.dead[:n]
+        return hit.nonzero()[0]
+    
+    def circles(self):
+        """Return the x, y and radius arrays of every comet, indexed by slot"""
+        n = self.store.count
+        return self.store.x[:n], self.store.y[:n], self.store.radius[:n]
+    
+    def live(self):
+        """Number of comets not shot this tick"""
+        store = self.store
+        return store.count - int(np.count_nonzero(store.dead[:store.count]))
+    
+    def kill(self, i):
+        """Mark the comet in slot i for removal at the end of the tick and return its position"""
+        self.store.kill(i)
+        return float(self.store.x[i]), float(self.store.y[i])
+    
+    def compact(self):
+        store = self.store
+        n = store.count
+        shot = store.shape[:n][store.dead[:n]].tolist()
+        if store.compact() is not None:
+            self._release(shot)
+    
+    def clear(self):
+        self._release(self.store.shape[:self.store.count].tolist())
+        self.store.clear()
+    
+    def _release(self, shape_ids):
+        for shape_id in shape_ids:
+            if shape_id >= 0:  # Swarm variants are shared, so they stay
+                shape_pool.release(self.shapes.pop(shape_id))
+    
+    def state(self):
+        """Pack the comets and the shapes they own as a pair of bytes for load_state()"""
+        store = self.store
+        owned = [self.shapes[shape_id] for shape_id in store.shape[:store.count].tolist() if shape_id >= 0]
+        shapes = np.zeros(len(owned), dtype=COMET_SHAPE_STATE)
+        for row, shape in zip(shapes, owned):
+            row["shape_id"] = shape.shape_id
+            row["variation"] = [variation for _, variation in shape.shape_points]
+            row["crater_count"] = len(shape.craters)
+            row["craters"][:len(shape.craters)] = shape.craters
+        return store.state(), shapes.tobytes()
+    
+    def check_state(self, data, shapes):
+        """Raise ValueError unless load_state() can take the state() pair (data, shapes)"""
+        store = self.store
+        count = store.state_count(data)
+        offset = 0
+        for name, column in store.fields.items():
+            if name == "shape":
+                break
+            offset += count * column.itemsize
+        shape_ids = np.frombuffer(data, store.shape.dtype, count, offset)
+        if np.any(shape_ids < -SWARM_SHAPE_VARIANTS):
+            raise ValueError("comet state names an unknown swarm shape")
+        owned, rest = divmod(len(shapes), COMET_SHAPE_STATE.itemsize)
+        if rest or owned != np.count_nonzero(shape_ids >= 0):
+            raise ValueError("comet shapes do not match the comets")
+    
+    def load_state(self, data, shapes, new_ids=False):
+        """Replace every comet with those from state(); new_ids gives the owned shapes fresh ids"""
+        self.check_state(data, shapes)
+        self.clear()
+        store = self.store
+        store.load_state(data)
+        rows = iter(np.frombuffer(shapes, dtype=COMET_SHAPE_STATE).tolist())
+        column = store.shape
+        for i, shape_id in enumerate(column[:store.count].tolist()):
+            if shape_id < 0:
+                self.shapes[shape_id] = CometShape.variant(-1 - shape_id)
+                continue
+            _, variations, craters, crater_count = next(rows)
+            if new_ids:
+                # Shape ids are sprite cache keys, so ids from another process could collide
+                shape_id = column[i] = next(CometShape._shape_ids)
+            shape = shape_pool.take()
+            shape.restore(shape_id, variations, [tuple(crater) for crater in craters[:crater_count]])
+            self.shapes[shape_id] = shape
+    
+    def draw(self, screen, alpha=1.0):
+        """Draw every comet and return the rects they cover"""
+        store = self.store
+        n = store.count
+        # alpha interpolates between the previous and current tick positions
+        xs = lerp(store.prev_x[:n], store.x[:n], alpha).tolist()
+        ys = lerp(store.prev_y[:n], store.y[:n], alpha).tolist()
+        shapes = self.shapes
+        return [shapes[shape_id].draw(screen, x, y, rotation)
+                for x, y, rotation, shape_id in zip(xs, ys, store.rotation[:n].tolist(),
+                                                    store.shape[:n].tolist())]
+    
+    def __len__(self):
+        return len(self.store)
+
+class ParticleSystem:
+    """Fixed-capacity particle bursts stored as NumPy arrays and updated in bulk"""
+    def __init__(self, capacity=PARTICLE_CAPACITY, rng=None):
+        self.capacity = capacity
+        self.count = 0
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.vx = np.zeros(capacity, dtype=np.float32)
+        self.vy = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.int16)
+        self.size = np.zeros(capacity, dtype=np.int8)
+        self.color = np.zeros(capacity, dtype=np.int8)  # Index into PARTICLE_COLORS
+        self._arrays = (self.x, self.y, self.vx, self.vy, self.life, self.size, self.color)
+        self._sprites = {}
+
+    def emit(self, x, y, n=None):
+        """Spawn a burst of n particles at (x, y), by default as many as the quality level allows"""
+        if n is None:
+            n = quality.particle_count
+        n = min(n, self.capacity)
+        overflow = self.count + n - self.capacity
+        if overflow > 0:
+            # Ring behaviour: drop the oldest particles to make room
+            keep = self.count - overflow
+            for array in self._arrays:
+                array[:keep] = array[overflow:self.count]
+            self.count = keep
+        start, end = self.count, self.count + n
+        rng = self.rng
+        self.x[start:end] = x
+        self.y[start:end] = y
+        self.vx[start:end] = rng.uniform(-3, 3, n)
+        self.vy[start:end] = rng.uniform(-3, 3, n)
+        self.life[start:end] = PARTICLE_LIFE
+        self.size[start:end] = rng.integers(3, 7, n)
+        self.color[start:end] = rng.integers(0, len(PARTICLE_COLORS), n)
+        self.count = end
+
+    def update(self):
+        count = self.count
+        if count == 0:
+            return
+        self.x[:count] += self.vx[:count]
+        self.y[:count] += self.vy[:count]
+        self.life[:count] -= 1
+        self.vy[:count] += PARTICLE_GRAVITY
+        alive = self.life[:count] > 0
+        if not alive.all():
+            # Compact survivors to the front in a single pass
+            survivors = int(alive.sum())
+            for array in self._arrays:
+                array[:survivors] = array[:count][alive]
+            self.count = survivors
+
+    def clear(self):
+        self.count = 0
+
+    def state(self):
+        return b"".join(array[:self.count].tobytes() for array in self._arrays)
+
+    def state_count(self, data):
+        """Return how many particles load_state(data) would hold, or raise ValueError if it can't"""
+        count, rest = divmod(len(data), sum(array.itemsize for array in self._arrays))
+        if rest or count > self.capacity:
+            raise ValueError("particle state does not fit the particle arrays")
+        return count
+
+    def load_state(self, data):
+        count = self.state_count(data)
+        offset = 0
+        for array in self._arrays:
+            array[:count] = np.frombuffer(data, array.dtype, count, offset)
+            offset += count * array.itemsize
+        self.count = count
+
+    def _sprite(self, color_index, size):
+        sprite = self._sprites.get((color_index, size))
+        if sprite is None:
+            sprite = pygame.Surface((size * 2 + 2, size * 2 + 2))
+            sprite.fill(SPRITE_COLORKEY)
+            pygame.draw.circle(sprite, PARTICLE_COLORS[color_index], (size + 1, size + 1), size)
+            sprite.set_colorkey(SPRITE_COLORKEY, pygame.RLEACCEL)
+            self._sprites[(color_index, size)] = sprite
+        return sprite
+
     def draw(self, screen):
-        alpha = int(255 * (self.life / 30))
-        color = tuple(min(255, c) for c in self.color)
-        pygame.draw.circle(screen, color, (int(self.x), int(self.y)), self.size)
+        """Draw every live particle and return the bounding box of the burst area"""
+        count = self.count
+        if count == 0:
+            return pygame.Rect(0, 0, 0, 0)
+        x = self.x[:count].astype(np.int32)
+        y = self.y[:count].astype(np.int32)
+        xs = x.tolist()
+        ys = y.tolist()
+        sizes = self.size[:count].tolist()
+        colors = self.color[:count].tolist()
+        screen.blits([(self._sprite(color, size), (x - size - 1, y - size - 1))
+                      for x, y, size, color in zip(xs, ys, sizes, colors)],
+                     doreturn=False)
+        reach = int(self.size[:count].max()) + 1
+        left, top = int(x.min()) - reach, int(y.min()) - reach
+        bounds = pygame.Rect(left, top, int(x.max()) + reach - left + 1, int(y.max()) + reach - top + 1)
+        return bounds.clip(screen.get_rect())
+
+    def __len__(self):
+        return self.count
+
+def swept_contact(x, y, dx, dy, radius, cx, cy, cradius):
+    """Earliest contact time of moving circles against static ones, as a (shots, targets) matrix
     
-    def is_alive(self):
-        return self.life > 0
+    Circle i moves from (x[i], y[i]) by (dx[i], dy[i]) over one tick. The
+    result is the fraction of that move, in [0, 1], at which it first
+    touches target circle j, or inf if it never does. Leading dimensions
+    are treated as a batch, so (N, shots) and (N, targets) arrays give an
+    (N, shots, targets) result.
+    """
+    fx = x[..., :, None] - cx[..., None, :]
+    fy = y[..., :, None] - cy[..., None, :]
+    reach = radius[..., :, None] + cradius[..., None, :]
+    dx = dx[..., :, None]
+    dy = dy[..., :, None]
+    # Solve |f + t * d| = reach for the smaller root t
+    a = np.maximum(dx * dx + dy * dy, 1e-12)  # A shot that isn't moving still has a root
+    b = 2 * (fx * dx + fy * dy)
+    c = fx * fx + fy * fy - reach * reach
+    discriminant = b * b - 4 * a * c
+    t = (-b - np.sqrt(np.maximum(discriminant, 0))) / (2 * a)
+    # c <= 0 means the circles already overlap at the start (and t <= 0)
+    hit = (c <= 0) | ((discriminant >= 0) & (t >= 0) & (t <= 1))
+    return np.where(hit, np.maximum(t, 0), np.inf)
+
+class ProjectileSystem:
+    """Player shots as component arrays: position, velocity, lifetime and collider radius
+    
+    Each tick update() moves every shot, collide() sweeps them against the
+    comets, and cull() kills the ones that expired or left the screen.
+    Killed shots are removed together by compact() at the end of the tick.
+    """
+    def __init__(self, capacity=PROJECTILE_CAPACITY):
+        self.store = ComponentStore(capacity, x=np.float64, y=np.float64,
+                                    prev_x=np.float64, prev_y=np.float64,
+                                    vx=np.float64, vy=np.float64,
+                                    life=np.int32, radius=np.float64,
+                                    serial=np.int64)  # Unique per shot, so it can be told apart after compaction
+        self.next_serial = 0
+    
+    def spawn(self, x, y, angle, speed=PROJECTILE_SPEED, radius=PROJECTILE_SIZE, life=PROJECTILE_LIFE):
+        store = self.store
+        if store.count < store.capacity:
+            store.spawn(x=x, y=y, prev_x=x, prev_y=y, vx=speed * math.cos(angle),
+                        vy=speed * math.sin(angle), life=life, radius=radius, serial=self.next_serial)
+            self.next_serial += 1
+    
+    def update(self):
+        store = self.store
+        n = store.count
+        if n == 0:
+            return
+        x, y = store.x[:n], store.y[:n]
+        store.prev_x[:n] = x
+        store.prev_y[:n] = y
+        x += store.vx[:n]
+        y += store.vy[:n]
+        store.life[:n] -= 1
+    
+    def collide(self, cx, cy, cradius):
+        """Kill the shots that hit a comet this tick and return the comet index each one hit
+        
+        Comets are given as arrays of center and radius. A shot hits the comet
+        its sweep touches first, and a comet taken by an earlier shot (in
+        firing order) is left for the next one in the shot's path.
+        """
+        store = self.store
+        n = store.count
+        if n == 0 or len(cx) == 0:
+            return []
+        x, y, vx, vy = store.prev_x[:n], store.prev_y[:n], store.vx[:n], store.vy[:n]
+        shots = np.flatnonzero(~store.dead[:n])
+        # The furthest apart, on either axis, a shot and a comet can be and still touch this tick
+        reach = (store.radius[:n].max() + cradius.max()
+                 + np.abs(vx).max() + np.abs(vy).max())
+        # Most ticks no shot is near a comet, so the pairs beyond reach are ruled out before
+        # sweeping: all at once when there are few, through a grid when there are many
+        if len(shots) * len(cx) <= GRID_MIN_PAIRS:
+            near = (np.abs(x[shots, None] - cx) <= reach) & (np.abs(y[shots, None] - cy) <= reach)
+            rows, pair_comets = near.nonzero()
+            pair_shots = shots[rows]
+        else:
+            pair_shots, pair_comets = self._grid_pairs(shots, cx, cy, reach)
+        if len(pair_shots) == 0:
+            return []
+        contact = swept_contact(x[pair_shots, None], y[pair_shots, None], vx[pair_shots, None],
+                                vy[pair_shots, None], store.radius[pair_shots, None],
+                                cx[pair_comets, None], cy[pair_comets, None],
+                                cradius[pair_comets, None]).ravel()
+        touching = np.flatnonzero(contact <= 1)
+        if len(touching) == 0:
+            return []
+        # Each shot in firing order takes the first comet along its sweep, ties going to the lower slot
+        order = np.lexsort((pair_comets[touching], contact[touching], pair_shots[touching]))
+        hits = []
+        taken = set()
+        fired = set()
+        for i, j in zip(pair_shots[touching][order].tolist(), pair_comets[touching][order].tolist()):
+            if i not in fired and j not in taken:
+                fired.add(i)
+                taken.add(j)
+                hits.append(j)
+                store.kill(i)
+        return hits
+    
+    def _grid_pairs(self, shots, cx, cy, reach):
+        """Return the (shot, comet) pairs within reach of each other on both axes, by shot
+        
+        Comets are binned into a grid of cells as wide as the reach, so the
+        comets a shot can be paired with are in the 3x3 cells around it.
+        """
+        store = self.store
+        x, y = store.prev_x[shots], store.prev_y[shots]
+        keys = np.floor(cx / reach).astype(np.int64) * GRID_STRIDE + np.floor(cy / reach).astype(np.int64)
+        comets = np.argsort(keys, kind="stable")  # By cell, then by slot
+        keys = keys[comets]
+        shot_keys = (np.floor(x / reach).astype(np.int64) * GRID_STRIDE
+                     + np.floor(y / reach).astype(np.int64))
+        # The run of sorted comets in each of the 9 cells around each shot
+        neighbors = shot_keys[:, None] + GRID_NEIGHBORS
+        start = np.searchsorted(keys, neighbors, "left").ravel()
+        counts = np.searchsorted(keys, neighbors, "right").ravel() - start
+        # One pair per comet in those runs, counting along each run from its start
+        run = np.repeat(np.arange(len(shots)), len(GRID_NEIGHBORS))
+        first = np.cumsum(counts) - counts
+        pair_shots = np.repeat(run, counts)
+        pair_comets = comets[np.repeat(start - first, counts) + np.arange(int(counts.sum()))]
+        near = np.flatnonzero((np.abs(x[pair_shots] - cx[pair_comets]) <= reach)
+                              & (np.abs(y[pair_shots] - cy[pair_comets]) <= reach))
+        return shots[pair_shots[near]], pair_comets[near]
+    
+    def cull(self):
+        """Kill the shots that expired or left the screen"""
+        store = self.store
+        n = store.count
+        if n == 0:
+            return
+        x, y = store.x[:n], store.y[:n]
+        store.dead[:n] |= (store.life[:n] <= 0) | (x < 0) | (x > WIDTH) | (y < 0) | (y > HEIGHT)
+    
+    def compact(self):
+        self.store.compact()
+    
+    def clear(self):
+        self.store.clear()
+    
+    def draw(self, screen, alpha=1.0):
+        """Draw every shot and return the rects they cover"""
+        store = self.store
+        n = store.count
+        if n == 0:
+            return []
+        # alpha interpolates between the previous and current tick positions
+        xs = lerp(store.prev_x[:n], store.x[:n], alpha).astype(np.int64).tolist()
+        ys = lerp(store.prev_y[:n], store.y[:n], alpha).astype(np.int64).tolist()
+        rects = []
+        for center, radius in zip(zip(xs, ys), store.radius[:n].astype(np.int64).tolist()):
+            pygame.draw.circle(screen, PROJECTILE_COLOR, center, radius)
+            rects.append(pygame.draw.circle(screen, (255, 255, 255), center, radius, 1))
+        return rects
+    
+    def __len__(self):
+        return len(self.store)
+
+shape_pool = Pool(CometShape)
+ENTITY_POOLS = (shape_pool,)
+
+def pool_allocations():
+    """Total number of instances the pools have had to construct"""
+    return sum(pool.allocations for pool in ENTITY_POOLS)
+
+def gc_collections():
+    """Total number of garbage collections run so far, across all generations"""
+    return sum(generation["collections"] for generation in gc.get_stats())
 
 def load_high_score():
     """Load high score from file, return 0 if file doesn't exist"""
@@ -486,186 +1360,1248 @@ def load_high_score():
             return 0
     return 0
 
+def write_atomic(path, text):
+    """Replace a file's contents so a crash leaves either the old or the new version"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb' if isinstance(text, bytes) else 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
 def save_high_score(score):
     """Save high score to file"""
     try:
-        with open(HIGH_SCORE_FILE, 'w') as f:
-            f.write(str(score))
+        write_atomic(HIGH_SCORE_FILE, str(score))
     except IOError:
         pass  # If we can't save, just continue
 
-def main():
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
-    pygame.display.set_caption("🌟 Star Collector - Use Arrow Keys or WASD!")
-    clock = pygame.time.Clock()
-    font = pygame.font.Font(None, 36)
-    big_font = pygame.font.Font(None, 72)
+class Leaderboard:
+    """Top scores kept in memory and persisted by a background thread
     
-    # Game state
-    player = Player(WIDTH // 2, HEIGHT // 2)
-    stars = []
-    obstacles = []
-    particles = []
-    projectiles = []
-    score = 0
-    high_score = load_high_score()
-    game_over = False
-    
-    # Main game loop
-    running = True
-    while running:
-        clock.tick(FPS)
-        
-        # Handle events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_r and game_over:
-                    # Restart game
-                    player = Player(WIDTH // 2, HEIGHT // 2)
-                    stars = []
-                    obstacles = []
-                    particles = []
-                    projectiles = []
-                    score = 0
-                    game_over = False
-                    high_score = load_high_score()  # Reload high score in case it was updated
-        
-        if not game_over:
-            # Handle input
-            keys = pygame.key.get_pressed()
-            dx, dy = 0, 0
-            
-            if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-                dx -= player.speed
-            if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-                dx += player.speed
-            if keys[pygame.K_UP] or keys[pygame.K_w]:
-                dy -= player.speed
-            if keys[pygame.K_DOWN] or keys[pygame.K_s]:
-                dy += player.speed
-            
-            player.move(dx, dy)
-            
-            # Auto-shoot in the direction player is moving (headfirst)
-            if dx != 0 or dy != 0:
-                projectile = player.shoot()
-                if projectile:
-                    projectiles.append(projectile)
-            
-            # Update projectiles
-            for projectile in projectiles[:]:
-                projectile.update()
-                if projectile.is_off_screen():
-                    projectiles.remove(projectile)
-                else:
-                    # Check collision with obstacles
-                    for obstacle in obstacles[:]:
-                        if projectile.get_rect().colliderect(obstacle.get_rect()):
-                            obstacles.remove(obstacle)
-                            projectiles.remove(projectile)
-                            score += 5  # Bonus for destroying obstacles
-                            # Create particles
-                            for _ in range(PARTICLE_COUNT):
-                                particles.append(Particle(obstacle.x, obstacle.y))
-                            break
-            
-            # Spawn stars
-            if random.random() < STAR_SPAWN_RATE and len(stars) < 10:
-                stars.append(Star())
-            
-            # Spawn obstacles
-            if random.random() < OBSTACLE_SPAWN_RATE and len(obstacles) < 5:
-                obstacles.append(Obstacle())
-            
-            # Update stars
-            for star in stars[:]:
-                star.update()
-                if player.get_rect().colliderect(star.get_rect()):
-                    # Collect star
-                    stars.remove(star)
-                    score += 10
-                    # Create particles
-                    for _ in range(PARTICLE_COUNT):
-                        particles.append(Particle(star.x, star.y))
-            
-            # Update obstacles
-            for obstacle in obstacles[:]:
-                obstacle.update()
-                if player.get_rect().colliderect(obstacle.get_rect()):
-                    game_over = True
-                    # Update high score if needed
-                    if score > high_score:
-                        high_score = score
-                        save_high_score(high_score)
-            
-            # Update particles
-            for particle in particles[:]:
-                particle.update()
-                if not particle.is_alive():
-                    particles.remove(particle)
-        
-        # Draw everything
-        screen.fill(BACKGROUND)
-        
-        # Draw stars
-        for star in stars:
-            star.draw(screen)
-        
-        # Draw obstacles
-        for obstacle in obstacles:
-            obstacle.draw(screen)
-        
-        # Draw particles
-        for particle in particles:
-            particle.draw(screen)
-        
-        # Draw projectiles
-        for projectile in projectiles:
-            projectile.draw(screen)
-        
-        # Draw player
-        player.draw(screen)
+    Finished games are appended to a log file and the log is periodically
+    compacted to the top scores with an atomic rename, so the game loop
+    never waits on the disk and a crash never loses the existing scores.
+    """
+    def __init__(self, path=LEADERBOARD_FILE, size=LEADERBOARD_SIZE):
+        self.path = path
+        self.size = size
+        self.scores = []  # Highest first
+        self._log_lines = 0
+        self._torn = False
+        for score in self._read_log():
+            self._insert(self.scores, score)
+        legacy = load_high_score()
+        if legacy > self.high_score:
+            self._insert(self.scores, legacy)
+        # What is on disk, only touched by the background thread
+        self._saved = list(self.scores)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="leaderboard", daemon=True)
+        self._thread.start()
+
+    @property
+    def high_score(self):
+        return self.scores[0] if self.scores else 0
+
+    def _read_log(self):
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.readlines()
+        except IOError:
+            return []
+        self._log_lines = len(lines)
+        if lines and not lines[-1].endswith("\n"):
+            # Torn write from a crash; rewrite the log before appending to it
+            self._torn = True
+            lines.pop()
+        scores = []
+        for line in lines:
+            try:
+                scores.append(int(line.split()[0]))
+            except (ValueError, IndexError):
+                continue
+        return scores
+
+    def _insert(self, scores, score):
+        scores.append(score)
+        scores.sort(reverse=True)
+        del scores[self.size:]
+
+    def submit(self, score):
+        """Record a finished game and queue it to be saved; returns True for a new high score"""
+        new_high = score > self.high_score
+        self._insert(self.scores, score)
+        self._queue.put((score, new_high))
+        return new_high
+
+    def _run(self):
+        if self._torn:
+            self._compact()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            score, new_high = item
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(f"{score} {int(time.time())}\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._insert(self._saved, score)
+                self._log_lines += 1
+                if self._log_lines >= LEADERBOARD_COMPACT_LINES:
+                    self._compact()
+            except IOError:
+                pass  # If we can't save, just continue
+            if new_high:
+                save_high_score(score)
+
+    def _compact(self):
+        now = int(time.time())
+        try:
+            write_atomic(self.path, "".join(f"{score} {now}\n" for score in self._saved))
+        except IOError:
+            return
+        self._log_lines = len(self._saved)
+
+    def close(self):
+        """Flush pending writes and stop the background thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+def new_seed():
+    """Pick a fresh 64-bit session seed"""
+    return int.from_bytes(os.urandom(8), "little")
+
+class World:
+    """Headless game state that advances one fixed tick at a time"""
+    def __init__(self, high_score=0, max_stars=MAX_STARS, max_obstacles=MAX_OBSTACLES, seed=None,
+                 star_spawn_rate=STAR_SPAWN_RATE, obstacle_spawn_rate=OBSTACLE_SPAWN_RATE,
+                 player_speed=PLAYER_SPEED, shoot_cooldown=SHOOT_COOLDOWN, swarm=False):
+        self.seed = new_seed() if seed is None else seed
+        # All gameplay randomness comes from this generator so sessions are reproducible
+        self.rng = random.Random(self.seed)
+        self.high_score = high_score
+        self.max_stars = max_stars
+        self.max_obstacles = max_obstacles
+        self.star_spawn_rate = star_spawn_rate
+        self.obstacle_spawn_rate = obstacle_spawn_rate
+        self.player_speed = player_speed
+        self.shoot_cooldown = shoot_cooldown
+        self.particles = ParticleSystem(rng=np.random.default_rng(self.seed))
+        # Every entity lives in component arrays; entities removed during a tick are
+        # only marked, and dropped together in _remove_dead() at the end of it
+        self.stars = StarField(max_stars)
+        # Swarm mode fills the screen with comets that share a few shapes
+        self.swarm = swarm
+        self.obstacles = CometField(max_obstacles)
+        self.projectiles = ProjectileSystem()
+        self.allocations = 0  # Pooled instances constructed during the last tick
+        self.profiler = FrameProfiler()
+        self.game_number = 0  # Games started in this world, so each one is only scored once
+        self.reset()
+
+    def reset(self):
+        """Start a fresh game, keeping the current high score"""
+        self.player = Player(WIDTH // 2, HEIGHT // 2, self.player_speed, self.shoot_cooldown)
+        self.game_number += 1
+        self.stars.clear()
+        self.obstacles.clear()
+        self.projectiles.clear()
+        self.particles.clear()
+        self.score = 0
+        self.game_over = False
+        self.tick = 0
+
+    def spawn_star(self):
+        """Add a star at a random position"""
+        rng = self.rng
+        x = rng.randint(STAR_SIZE, WIDTH - STAR_SIZE)
+        y = rng.randint(STAR_SIZE, HEIGHT - STAR_SIZE)
+        self.stars.spawn(x, y, rng.randrange(len(STAR_COLORS)), self.tick)
+
+    def spawn_obstacle(self):
+        """Add a comet at a random position, heading in a random direction"""
+        rng = self.rng
+        x = rng.randint(OBSTACLE_SIZE, WIDTH - OBSTACLE_SIZE)
+        y = rng.randint(OBSTACLE_SIZE, HEIGHT - OBSTACLE_SIZE)
+        speed = rng.uniform(1, 3)
+        angle = rng.uniform(0, 2 * math.pi)
+        if self.swarm:
+            shape = CometShape.variant(rng.randrange(SWARM_SHAPE_VARIANTS))
+        else:
+            shape = shape_pool.acquire(rng)
+        # The heading only changes on a bounce, so it is kept as a velocity vector
+        self.obstacles.spawn(x, y, speed * math.cos(angle), speed * math.sin(angle), shape)
+
+    def step(self, inputs=0):
+        """Advance the game by one tick given a bitmask of INPUT_* flags"""
+        if self.game_over:
+            if not inputs & INPUT_RESTART:
+                return
+            self.reset()
+        self.tick += 1
+        player = self.player
+        allocations_before = pool_allocations()
+
+        # Handle input
+        dx, dy = 0, 0
+        if inputs & INPUT_LEFT:
+            dx -= player.speed
+        if inputs & INPUT_RIGHT:
+            dx += player.speed
+        if inputs & INPUT_UP:
+            dy -= player.speed
+        if inputs & INPUT_DOWN:
+            dy += player.speed
+
+        player.move(dx, dy)
+
+        # Auto-shoot in the direction player is moving (headfirst)
+        if dx != 0 or dy != 0:
+            player.shoot(self.projectiles)
+        profiler = self.profiler
+        profiler.lap("player")
+
+        # Sweep projectiles along this tick's move against the comets where
+        # they were at the end of last tick, so fast shots can't skip past one
+        projectiles = self.projectiles
+        comets = self.obstacles
+        projectiles.update()
+        if len(projectiles) and len(comets):
+            for i in projectiles.collide(*comets.circles()):
+                x, y = comets.kill(i)
+                self.score += 5  # Bonus for destroying obstacles
+                # Create particles
+                self.particles.emit(x, y)
+        projectiles.cull()
+
+        profiler.lap("projectiles")
+
+        # Spawn stars
+        if self.rng.random() < self.star_spawn_rate and len(self.stars) < self.max_stars:
+            self.spawn_star()
+
+        # Spawn obstacles
+        if self.rng.random() < self.obstacle_spawn_rate and comets.live() < self.max_obstacles:
+            self.spawn_obstacle()
+
+        profiler.lap("spawn")
+        player_rect = player.get_rect()
+
+        # Collect the stars the player touches
+        stars = self.stars
+        for i in stars.colliding(player_rect).tolist():
+            # Collect star
+            x, y = stars.kill(i)
+            self.score += 10
+            # Create particles
+            self.particles.emit(x, y)
+
+        profiler.lap("stars")
+
+        # Update obstacles
+        comets.update()
+        if len(comets.colliding(player_rect)):
+            self.game_over = True
+            # Update high score if needed
+            if self.score > self.high_score:
+                self.high_score = self.score
+
+        profiler.lap("obstacles")
+
+        # Update particles
+        self.particles.update()
+        profiler.lap("particles")
+
+        self._remove_dead()
+        profiler.lap("cleanup")
+        self.allocations = pool_allocations() - allocations_before
+
+    def _remove_dead(self):
+        """Drop everything collected, shot or expired this tick with one pass per store"""
+        self.projectiles.compact()
+        self.stars.compact()
+        self.obstacles.compact()
+
+    def snapshot(self, previous=None):
+        """Capture the whole game as a tuple of byte sections that restore() accepts
         
-        # Draw UI
-        score_text = font.render(f"Score: {score}", True, TEXT_COLOR)
-        high_score_text = font.render(f"High Score: {high_score}", True, TEXT_COLOR)
-        screen.blit(score_text, (10, 10))
-        screen.blit(high_score_text, (10, 50))
+        Sections equal to the same section of previous are shared with it
+        instead of stored again, so a run of snapshots mostly holds the parts
+        that changed (the RNG's words, for one, only change every few hundred
+        draws).
+        """
+        player = self.player
+        trail = player.flame_trail
+        _, words, gauss = self.rng.getstate()
+        pcg = self.particles.rng.bit_generator.state
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SNAPSHOT_PROCESS, self.seed, self.tick, self.score,
+            self.high_score, self.game_over, self.swarm, self.max_stars, self.max_obstacles,
+            self.star_spawn_rate, self.obstacle_spawn_rate, self.player_speed, self.shoot_cooldown,
+            player.x, player.y, player.last_x, player.last_y, player.angle, player.jetpack_flame,
+            player.shoot_cooldown, trail.head, words[-1], gauss is not None, gauss or 0.0,
+            pcg["state"]["state"].to_bytes(16, "little"), pcg["state"]["inc"].to_bytes(16, "little"),
+            pcg["has_uint32"], pcg["uinteger"], self.projectiles.next_serial, self.game_number,
+            self.stars.next_serial, self.obstacles.next_serial)
+        comets, shapes = self.obstacles.state()
+        sections = (header, np.array(words[:-1], dtype=np.uint32).tobytes(), trail.state(),
+                    self.stars.store.state(), comets, shapes, self.projectiles.store.state(),
+                    self.particles.state())
+        if previous is None:
+            return sections
+        return tuple(old if old == new else new for old, new in zip(previous, sections))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Build a world with the settings of a snapshot and restore it"""
+        header = cls._snapshot_header(snapshot)
+        world = cls(seed=header[3], swarm=header[8], max_stars=header[9], max_obstacles=header[10],
+                    star_spawn_rate=header[11], obstacle_spawn_rate=header[12],
+                    player_speed=header[13], shoot_cooldown=header[14])
+        world.restore(snapshot)
+        return world
+
+    @staticmethod
+    def _snapshot_header(snapshot):
+        if len(snapshot) != SNAPSHOT_SECTIONS or len(snapshot[0]) != SNAPSHOT_HEADER.size:
+            raise ValueError("not a game snapshot")
+        header = SNAPSHOT_HEADER.unpack(snapshot[0])
+        if header[0] != SNAPSHOT_MAGIC or header[1] != SNAPSHOT_VERSION:
+            raise ValueError(f"not a version {SNAPSHOT_VERSION} game snapshot")
+        return header
+
+    def restore(self, snapshot):
+        """Return the game to a snapshot(), taken from this world or one in the same mode"""
+        header = self._snapshot_header(snapshot)
+        if header[8] != self.swarm:
+            raise ValueError("snapshot is from the other game mode")
+        if header[9] > self.stars.store.capacity or header[10] > self.obstacles.store.capacity:
+            raise ValueError("snapshot allows more stars or comets than this world holds")
+        _, words, trail, stars, comets, shapes, shots, particles = snapshot
+        # Every section is checked before any of the game changes, so a damaged
+        # snapshot raises ValueError and leaves the game as it was
+        if len(words) != MT_STATE_WORDS * 4 or not 0 <= header[23] <= MT_STATE_WORDS:
+            raise ValueError("snapshot has a damaged random state")
+        flame_trail = FlameTrail.from_state(trail, header[22])
+        self.stars.store.state_count(stars)
+        self.obstacles.check_state(comets, shapes)
+        self.projectiles.store.state_count(shots)
+        self.particles.state_count(particles)
+        (_, _, process, self.seed, self.tick, self.score, high_score, self.game_over, _,
+         self.max_stars, self.max_obstacles, self.star_spawn_rate, self.obstacle_spawn_rate,
+         self.player_speed, self.shoot_cooldown, x, y, last_x, last_y, angle, jetpack_flame,
+         shot_cooldown, trail_head, rng_index, has_gauss, gauss, pcg_state, pcg_inc,
+         pcg_has_uint32, pcg_uinteger, self.projectiles.next_serial, self.game_number,
+         self.stars.next_serial, self.obstacles.next_serial) = header
+        self.high_score = max(self.high_score, high_score)
+        self.rng.setstate((random.Random.VERSION,
+                           tuple(np.frombuffer(words, dtype=np.uint32).tolist()) + (rng_index,),
+                           gauss if has_gauss else None))
+        self.particles.rng.bit_generator.state = {
+            "bit_generator": "PCG64",
+            "state": {"state": int.from_bytes(pcg_state, "little"),
+                      "inc": int.from_bytes(pcg_inc, "little")},
+            "has_uint32": int(pcg_has_uint32), "uinteger": pcg_uinteger,
+        }
+
+        player = self.player = Player(x, y, self.player_speed, self.shoot_cooldown)
+        player.last_x, player.last_y = last_x, last_y
+        player.angle = angle
+        player.jetpack_flame = jetpack_flame
+        player.shoot_cooldown = shot_cooldown
+        player.flame_trail = flame_trail
+
+        self.stars.store.load_state(stars)
+        self.obstacles.load_state(comets, shapes, new_ids=process != SNAPSHOT_PROCESS)
+        self.projectiles.store.load_state(shots)
+        self.particles.load_state(particles)
+
+# Keys that steer the player, mapped to their INPUT_* flag
+KEY_INPUTS = {
+    pygame.K_LEFT: INPUT_LEFT, pygame.K_a: INPUT_LEFT,
+    pygame.K_RIGHT: INPUT_RIGHT, pygame.K_d: INPUT_RIGHT,
+    pygame.K_UP: INPUT_UP, pygame.K_w: INPUT_UP,
+    pygame.K_DOWN: INPUT_DOWN, pygame.K_s: INPUT_DOWN,
+}
+
+class InputState:
+    """Keyboard state built from the event queue so taps between ticks are never lost"""
+    def __init__(self):
+        self.held = {}  # key -> INPUT_* flag for keys currently down
+        self.tapped = 0  # Flags pressed since the last tick, even if already released
+
+    def handle(self, event):
+        if event.type == pygame.KEYDOWN:
+            flag = KEY_INPUTS.get(event.key)
+            if flag:
+                self.held[event.key] = flag
+                self.tapped |= flag
+        elif event.type == pygame.KEYUP:
+            self.held.pop(event.key, None)
+        elif event.type == pygame.WINDOWFOCUSLOST:
+            # Key releases are not delivered while unfocused
+            self.held.clear()
+
+    def press(self, flag):
+        """Deliver a one-off input (such as INPUT_RESTART) on the next tick"""
+        self.tapped |= flag
+
+    def consume(self):
+        """Return the INPUT_* bitmask for the next tick"""
+        inputs = self.tapped
+        for flag in self.held.values():
+            inputs |= flag
+        self.tapped = 0
+        return inputs
+
+class ReplayWriter:
+    """Stream a session's seed and per-tick input bytes to a replay file"""
+    def __init__(self, path, seed):
+        self.file = open(path, "wb")
+        self.file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, seed))
+        self.ticks = 0
+
+    def record(self, inputs):
+        self.file.write(bytes((inputs,)))
+        self.ticks += 1
+
+    def close(self):
+        self.file.close()
+
+def read_replay(path):
+    """Return (seed, inputs) from a replay file, where inputs is a bytes object"""
+    with open(path, "rb") as f:
+        header = f.read(REPLAY_HEADER.size)
+        if len(header) < REPLAY_HEADER.size:
+            raise ValueError(f"{path} is not a replay file")
+        magic, version, seed = REPLAY_HEADER.unpack(header)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a version {REPLAY_VERSION} replay file")
+        return seed, f.read()
+
+def run_replay(seed, inputs):
+    """Play recorded inputs back headless as fast as possible and return the final World"""
+    world = World(seed=seed)
+    for tick_inputs in inputs:
+        world.step(tick_inputs)
+    return world
+
+def pack_snapshot(snapshot):
+    """Join a snapshot's sections into one byte string, each prefixed with its length"""
+    return b"".join(struct.pack("<I", len(section)) + section for section in snapshot)
+
+def unpack_snapshot(data):
+    """Split bytes from pack_snapshot() back into a snapshot's sections"""
+    sections = []
+    offset = 0
+    while offset < len(data):
+        if offset + 4 > len(data):
+            raise ValueError("truncated game snapshot")
+        (length,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        if offset + length > len(data):
+            raise ValueError("truncated game snapshot")
+        sections.append(data[offset:offset + length])
+        offset += length
+    return tuple(sections)
+
+class RewindBuffer:
+    """The last few seconds of a game, for rewinding it tick by tick
+    
+    record() is called with the inputs of every tick before they are applied.
+    Every `interval` ticks it also takes a snapshot sharing the sections that
+    haven't changed with the one before, so most ticks only cost one byte.
+    rewind() restores the newest snapshot at or before the target tick and
+    replays the recorded inputs from there.
+    """
+    def __init__(self, seconds=REWIND_SECONDS, interval=REWIND_INTERVAL):
+        self.interval = interval
+        self.capacity = max(1, int(seconds * FPS) // interval)  # Snapshots kept
+        self.snapshots = deque()  # (position, snapshot), oldest first
+        self.inputs = bytearray()  # Inputs of every tick since the oldest snapshot
+        self.position = 0  # Ticks recorded so far
+        self.snapshot_ns = deque(maxlen=PROFILE_WINDOW)
+        self.restore_ns = deque(maxlen=PROFILE_WINDOW)
+
+    def record(self, world, inputs):
+        position = self.position
+        if not self.snapshots or (position % self.interval == 0 and self.snapshots[-1][0] < position):
+            start = time.perf_counter_ns()
+            previous = self.snapshots[-1][1] if self.snapshots else None
+            self.snapshots.append((position, world.snapshot(previous)))
+            self.snapshot_ns.append(time.perf_counter_ns() - start)
+            if len(self.snapshots) > self.capacity:
+                self.snapshots.popleft()
+                del self.inputs[:self.snapshots[0][0] - self._start]
+        self.inputs.append(inputs)
+        self.position += 1
+
+    @property
+    def _start(self):
+        """Position of the first recorded input"""
+        return self.position - len(self.inputs)
+
+    def rewind(self, world, ticks):
+        """Take the world back up to ticks ticks and return how many it went back"""
+        if not self.snapshots:
+            return 0
+        target = max(self.position - ticks, self.snapshots[0][0])
+        start = time.perf_counter_ns()
+        while self.snapshots[-1][0] > target:
+            self.snapshots.pop()
+        position, snapshot = self.snapshots[-1]
+        world.restore(snapshot)
+        first = position - self._start
+        for inputs in self.inputs[first:first + target - position]:
+            world.step(inputs)
+        del self.inputs[target - self._start:]
+        rewound = self.position - target
+        self.position = target
+        self.restore_ns.append(time.perf_counter_ns() - start)
+        return rewound
+
+    def clear(self):
+        self.snapshots.clear()
+        self.inputs.clear()
+
+    def memory(self):
+        """Bytes held by the snapshots, counting shared sections once, and the inputs"""
+        sections = {id(section): len(section)
+                    for _, snapshot in self.snapshots for section in snapshot}
+        return sum(sections.values()) + len(self.inputs)
+
+class FrameProfiler:
+    """Times each phase of a frame with perf_counter_ns; does nothing unless enabled"""
+    def __init__(self, export_path=None, window=PROFILE_WINDOW):
+        self.enabled = export_path is not None
+        self.frame = 0
+        self.frame_times = deque(maxlen=window)  # Total frame time in ns
+        self.phase_ns = dict.fromkeys(PROFILE_PHASES, 0)
+        self.counts = {}
+        self.startup = {}  # Milliseconds from main() to each startup milestone
+        self._frame_start = 0
+        self._last = 0
+        self._allocations = 0  # Pool allocations and garbage collections when the frame began
+        self._collections = 0
+        self._export = None
+        self._writer = None
+        if export_path is not None:
+            self._export = open(export_path, "w", newline="")
+            if not export_path.endswith((".jsonl", ".json")):
+                self._writer = csv.writer(self._export)
+                self._writer.writerow(("frame", "total_ns") + PROFILE_PHASES
+                                      + ("star_count", "obstacle_count", "projectile_count",
+                                         "particle_count", "allocation_count", "gc_count"))
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self._frame_start = self._last = time.perf_counter_ns()
+        self._allocations = pool_allocations()
+        self._collections = gc_collections()
+        for phase in self.phase_ns:
+            self.phase_ns[phase] = 0
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to phase"""
+        if not self.enabled:
+            return
+        now = time.perf_counter_ns()
+        self.phase_ns[phase] += now - self._last
+        self._last = now
+
+    def end_frame(self, world):
+        if not self.enabled:
+            return
+        total = time.perf_counter_ns() - self._frame_start
+        self.frame += 1
+        self.frame_times.append(total)
+        self.counts = {
+            "star_count": len(world.stars),
+            "obstacle_count": len(world.obstacles),
+            "projectile_count": len(world.projectiles),
+            "particle_count": len(world.particles),
+            # Entities the pools had to construct and garbage collections run this frame,
+            # both of which stay at zero in steady-state play
+            "allocation_count": pool_allocations() - self._allocations,
+            "gc_count": gc_collections() - self._collections,
+        }
+        if self._writer is not None:
+            self._writer.writerow([self.frame, total] + list(self.phase_ns.values())
+                                  + list(self.counts.values()))
+        elif self._export is not None:
+            row = {"frame": self.frame, "total_ns": total}
+            row.update(self.phase_ns)
+            row.update(self.counts)
+            self._export.write(json.dumps(row) + "\n")
+
+    def percentiles(self):
+        """Return the (p50, p95, p99) frame times in milliseconds"""
+        if not self.frame_times:
+            return 0.0, 0.0, 0.0
+        ordered = sorted(self.frame_times)
+        last = len(ordered) - 1
+        return tuple(ordered[int(last * p)] / 1e6 for p in (0.50, 0.95, 0.99))
+
+    def close(self):
+        if self._export is not None:
+            self._export.close()
+            self._export = None
+            self._writer = None
+
+class ProfilerOverlay:
+    """Toggleable on-screen readout of frame-time percentiles and entity counts"""
+    def __init__(self, profiler, visible=False, font=None, rewind=None):
+        self.profiler = profiler
+        self.rewind = rewind
+        self.visible = visible
+        self.font = font or pygame.font.Font(None, 22)
+        self.lines = []
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.lines = []
+
+    def draw(self, screen):
+        if not self.visible:
+            return pygame.Rect(0, 0, 0, 0)
+        profiler = self.profiler
+        # Re-rendering the text every frame would itself show up in the timings
+        if not self.lines or profiler.frame % PROFILE_OVERLAY_REFRESH == 0:
+            p50, p95, p99 = profiler.percentiles()
+            text = [f"frame p50 {p50:.2f}ms  p95 {p95:.2f}ms  p99 {p99:.2f}ms"]
+            text.append("  ".join(f"{name[:-6]} {count}" for name, count in profiler.counts.items()))
+            text.extend(f"{phase:<12}{ns / 1e6:6.2f}ms" for phase, ns in profiler.phase_ns.items())
+            text.append(f"quality {quality.name}")
+            rewind = self.rewind
+            if rewind is not None and rewind.snapshot_ns:
+                text.append(f"rewind {rewind.memory() / 1024:.0f}KiB  "
+                            f"snapshot {max(rewind.snapshot_ns) / 1e6:.2f}ms  "
+                            f"restore {max(rewind.restore_ns, default=0) / 1e6:.2f}ms")
+            if profiler.startup:
+                text.append("startup " + "  ".join(f"{name} {ms:.0f}ms"
+                                                   for name, ms in profiler.startup.items()))
+            self.lines = [self.font.render(line, True, TEXT_COLOR) for line in text]
+        y = 90
+        rect = pygame.Rect(WIDTH - 330, y, 0, 0)
+        for line in self.lines:
+            rect.union_ip(screen.blit(line, (WIDTH - 330, y)))
+            y += line.get_height()
+        return rect
+
+class CachedText:
+    """A line of text that is only re-rasterized when its string changes"""
+    def __init__(self, font, color=TEXT_COLOR):
+        self.font = font
+        self.color = color
+        self.text = None
+        self.surface = None
+
+    def render(self, text):
+        if text != self.text:
+            self.text = text
+            self.surface = self.font.render(text, True, self.color)
+        return self.surface
+
+class Hud:
+    """Score readout, instructions and game over screen, composed into a cached layer"""
+    def __init__(self, font, big_font, leaderboard=None):
+        self.leaderboard = leaderboard
+        self.score_text = CachedText(font)
+        self.high_score_text = CachedText(font)
+        self.final_score_text = CachedText(font)
+        self.top_scores_text = CachedText(font)
+        self.instructions = font.render("Use Arrow Keys or WASD to move!", True, TEXT_COLOR)
+        self.game_over_text = big_font.render("GAME OVER!", True, (255, 50, 50))
+        self.restart_text = font.render("Press R to Restart", True, TEXT_COLOR)
+        self.overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        self.overlay.fill((0, 0, 0, 180))
+        self.layer = convert_surface(pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA), alpha=True)
+        self.layer_key = None  # What the layer currently shows
+        self.rects = []  # Areas of the layer with something drawn on them
+
+    def draw(self, screen, world):
+        """Draw the HUD and return the rects it touched"""
+        top_scores = ()
+        if world.game_over and self.leaderboard is not None:
+            top_scores = tuple(self.leaderboard.scores[:5])
+        key = (world.score, world.high_score, world.game_over, top_scores)
+        if key != self.layer_key:
+            self.layer_key = key
+            self.compose(world, top_scores)
+        for rect in self.rects:
+            screen.blit(self.layer, rect, rect)
+        return list(self.rects)
+
+    def compose(self, world, top_scores):
+        """Redraw the HUD layer, which only happens when what it shows changes"""
+        layer = self.layer
+        layer.fill((0, 0, 0, 0))
+        rects = [
+            layer.blit(self.score_text.render(f"Score: {world.score}"), (10, 10)),
+            layer.blit(self.high_score_text.render(f"High Score: {world.high_score}"), (10, 50)),
+        ]
         
-        if game_over:
+        if world.game_over:
             # Draw game over screen
-            overlay = pygame.Surface((WIDTH, HEIGHT))
-            overlay.set_alpha(180)
-            overlay.fill((0, 0, 0))
-            screen.blit(overlay, (0, 0))
+            rects = [layer.blit(self.overlay, (0, 0))]
             
-            game_over_text = big_font.render("GAME OVER!", True, (255, 50, 50))
-            final_score_text = font.render(f"Final Score: {score}", True, TEXT_COLOR)
-            restart_text = font.render("Press R to Restart", True, TEXT_COLOR)
+            game_over_text = self.game_over_text
+            final_score_text = self.final_score_text.render(f"Final Score: {world.score}")
+            restart_text = self.restart_text
             
-            screen.blit(game_over_text, 
+            layer.blit(game_over_text, 
                        (WIDTH // 2 - game_over_text.get_width() // 2, 
                         HEIGHT // 2 - 100))
-            screen.blit(final_score_text, 
+            layer.blit(final_score_text, 
                        (WIDTH // 2 - final_score_text.get_width() // 2, 
                         HEIGHT // 2 - 20))
-            screen.blit(restart_text, 
+            layer.blit(restart_text, 
                        (WIDTH // 2 - restart_text.get_width() // 2, 
                         HEIGHT // 2 + 40))
+            if top_scores:
+                top_scores_text = self.top_scores_text.render(
+                    "Top Scores: " + ", ".join(str(score) for score in top_scores))
+                layer.blit(top_scores_text, 
+                           (WIDTH // 2 - top_scores_text.get_width() // 2, 
+                            HEIGHT // 2 + 100))
         else:
             # Draw instructions
-            if score == 0:
-                instructions = font.render("Use Arrow Keys or WASD to move!", True, TEXT_COLOR)
-                screen.blit(instructions, 
-                           (WIDTH // 2 - instructions.get_width() // 2, HEIGHT - 50))
+            if world.score == 0:
+                instructions = self.instructions
+                rects.append(layer.blit(instructions, 
+                                        (WIDTH // 2 - instructions.get_width() // 2, HEIGHT - 50)))
+        self.rects = rects
+
+class ParallaxLayer:
+    """Screen-sized tile of stars that scrolls with wraparound"""
+    def __init__(self, rng, drift, depth, count, radius, color):
+        self.drift = drift
+        self.depth = depth
+        surface = pygame.Surface((WIDTH, HEIGHT))
+        surface.fill(SPRITE_COLORKEY)
+        for _ in range(count):
+            # Stars stay clear of the edges so none are cut in half at the wrap seam
+            x = rng.randint(radius, WIDTH - radius - 1)
+            y = rng.randint(radius, HEIGHT - radius - 1)
+            pygame.draw.circle(surface, color, (x, y), radius)
+        self.surface = convert_surface(surface)
+        # Almost all of the tile is transparent, which RLE skips over cheaply
+        self.surface.set_colorkey(SPRITE_COLORKEY, pygame.RLEACCEL)
+
+    def draw(self, screen, scroll, player_x, player_y):
+        offset_x = int(scroll * self.drift + (player_x - WIDTH / 2) * self.depth) % WIDTH
+        offset_y = int((player_y - HEIGHT / 2) * self.depth) % HEIGHT
+        # Once offset, the tile and up to three wrapped copies cover the screen
+        for x in ((-offset_x, WIDTH - offset_x) if offset_x else (0,)):
+            for y in ((-offset_y, HEIGHT - offset_y) if offset_y else (0,)):
+                screen.blit(self.surface, (x, y))
+
+class Background:
+    """Pre-rendered backdrop: a static nebula layer under scrolling parallax star layers"""
+    def __init__(self, parallax=True):
+        rng = random.Random(BACKGROUND_SEED)
+        base = pygame.Surface((WIDTH, HEIGHT))
+        base.fill(BACKGROUND)
+        for _ in range(NEBULA_COUNT):
+            self._draw_nebula(base, rng)
+        for _ in range(FAR_STAR_COUNT):
+            shade = rng.randint(50, 90)
+            base.set_at((rng.randrange(WIDTH), rng.randrange(HEIGHT)), (shade, shade, shade + 30))
+        self.base = convert_surface(base)
+        self.layers = [ParallaxLayer(rng, *layer) for layer in PARALLAX_LAYERS] if parallax else []
+
+    @staticmethod
+    def _draw_nebula(surface, rng):
+        radius = rng.randint(120, 260)
+        color = rng.choice(NEBULA_COLORS)
+        cloud = pygame.Surface((radius * 2, radius * 2), pygame.SRCALPHA)
+        # Shrinking discs drawn over each other get more opaque towards the middle
+        for r in range(radius, 0, -4):
+            pygame.draw.circle(cloud, (*color, int(60 * (1 - r / radius))), (radius, radius), r)
+        surface.blit(cloud, (rng.randrange(WIDTH) - radius, rng.randrange(HEIGHT) - radius))
+
+    def draw(self, screen, scroll=0.0, player_x=WIDTH / 2, player_y=HEIGHT / 2):
+        """Draw every layer, with parallax layers offset by scroll ticks and the player position"""
+        screen.blit(self.base, (0, 0))
+        for layer in self.layers:
+            layer.draw(screen, scroll, player_x, player_y)
+
+    def restore(self, screen, rect):
+        """Repaint one area of the screen from the static layer"""
+        screen.blit(self.base, rect, rect)
+
+class DirtyRectRenderer:
+    """Clears and pushes only the screen areas that changed since the last frame
+    
+    Areas are cleared from the background's static layer, so parallax layers
+    (which would change the whole screen every frame) are not drawn.
+    """
+    def __init__(self, background=None):
+        self.background = background
+        self.previous = []  # Rects drawn last frame, which must be erased this frame
+        self.full_redraw = True
+
+    def clear(self, screen):
+        rects = [screen.get_rect()] if self.full_redraw else self.previous
+        for rect in rects:
+            if self.background is not None:
+                self.background.restore(screen, rect)
+            else:
+                screen.fill(BACKGROUND, rect)
+
+    def present(self, rects, full=False):
+        """Push this frame's rects plus last frame's to the display"""
+        if full or self.full_redraw:
+            pygame.display.flip()
+        else:
+            pygame.display.update(merge_rects(self.previous + rects))
+        self.previous = rects
+        # A full-screen overlay must also be erased in full on the next frame
+        self.full_redraw = full
+
+def merge_rects(rects):
+    """Union overlapping rects so each screen area is only pushed once"""
+    merged = []
+    for rect in rects:
+        if not rect:
+            continue
+        rect = rect.copy()
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+def write_png(path, rgb, level=CAPTURE_PNG_LEVEL):
+    """Write a (height, width, 3) uint8 array as a PNG
+    
+    Encoded with zlib, which releases the GIL while it compresses, so a
+    writer thread doesn't stall the game the way pygame.image.save does.
+    """
+    height, width, _ = rgb.shape
+    pixels = rgb.reshape(height, width * 3)
+    # Every row uses the Sub filter: each byte minus the same channel of the pixel to its left
+    rows = np.empty((height, width * 3 + 1), np.uint8)
+    rows[:, 0] = 1
+    rows[:, 1:4] = pixels[:, :3]
+    np.subtract(pixels[:, 3:], pixels[:, :-3], out=rows[:, 4:])
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        for kind, data in ((b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+                           (b"IDAT", zlib.compress(rows, level)), (b"IEND", b"")):
+            f.write(struct.pack(">I", len(data)) + kind)
+            f.write(data)
+            f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+class FrameCapture:
+    """Records presented frames through a ring of preallocated buffers and a writer thread
+    
+    The main loop only copies the screen's pixels into a free buffer. The
+    writer converts them to RGB and writes raw frames to a file, a numbered
+    PNG sequence, or an encoder's stdin. When every buffer is still waiting
+    for the writer, the frame is dropped and counted instead of holding up
+    the game.
+    """
+    def __init__(self, screen, path=None, command=None, buffers=CAPTURE_BUFFERS):
+        if screen.get_bytesize() not in (3, 4):
+            raise ValueError("frame capture needs a 24 or 32-bit display")
+        self.size = screen.get_size()
+        self.frames = 0  # Frames offered, including dropped ones
+        self.dropped = 0
+        self.written = 0
+        self.copy_ns = 0  # Main-loop time spent copying frames
+        self.error = None
+        self._pitch = screen.get_pitch()
+        bytesize = screen.get_bytesize()
+        self._bytesize = bytesize
+        # Byte of each pixel holding red, green and blue
+        self._channels = [shift // 8 if sys.byteorder == "little" else bytesize - 1 - shift // 8
+                          for shift in screen.get_shifts()[:3]]
+        self._buffers = [np.empty(self._pitch * self.size[1], np.uint8) for _ in range(buffers)]
+        self._free = queue.Queue()
+        for index in range(buffers):
+            self._free.put(index)
+        self._filled = queue.Queue()
+        self._png = None
+        self._process = None
+        if command:
+            self._process = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE)
+            self._out = self._process.stdin
+        elif path.endswith(".png"):
+            self._png = path[:-4] + "_{:06d}.png"
+        else:
+            self._out = open(path, "wb")
+        self._thread = threading.Thread(target=self._run, name="frame-capture", daemon=True)
+        self._thread.start()
+
+    def capture(self, screen):
+        """Copy the presented frame into a free buffer; returns False if it was dropped"""
+        self.frames += 1
+        try:
+            index = self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return False
+        start = time.perf_counter_ns()
+        view = screen.get_view("0")
+        np.copyto(self._buffers[index], np.frombuffer(view, np.uint8))
+        del view  # The screen stays locked while a view of it is alive
+        self._filled.put((index, self.frames))
+        self.copy_ns += time.perf_counter_ns() - start
+        return True
+
+    def _run(self):
+        width, height = self.size
+        rgb = np.empty((height, width, 3), np.uint8)
+        while True:
+            item = self._filled.get()
+            if item is None:
+                return
+            index, frame = item
+            pixels = self._buffers[index].reshape(height, self._pitch)[:, :width * self._bytesize]
+            pixels = pixels.reshape(height, width, self._bytesize)
+            for channel, byte in enumerate(self._channels):
+                rgb[:, :, channel] = pixels[:, :, byte]
+            self._free.put(index)
+            if self.error is not None:
+                continue  # Keep freeing buffers so the game carries on
+            try:
+                if self._png:
+                    write_png(self._png.format(frame), rgb)
+                else:
+                    self._out.write(rgb)
+                self.written += 1
+            except (OSError, ValueError) as error:
+                self.error = error
+
+    def close(self):
+        """Write the queued frames, stop the writer and return a one-line summary"""
+        self._filled.put(None)
+        self._thread.join()
+        if not self._png:
+            try:
+                self._out.close()
+            except OSError as error:
+                self.error = self.error or error
+        if self._process:
+            self._process.wait()
+        copied = self.frames - self.dropped
+        summary = (f"Captured {self.written} of {self.frames} frames ({self.dropped} dropped), "
+                   f"{self.copy_ns / max(copied, 1) / 1e6:.2f}ms copy per frame")
+        if self.error is not None:
+            summary += f"; writing stopped: {self.error}"
+        return summary
+
+def draw_world(screen, world, hud, renderer=None, alpha=1.0, background=None):
+    """Render the world and the HUD onto the screen surface and return the rects drawn
+    
+    alpha is how far rendering is between the previous tick (0) and the
+    current one (1), so motion stays smooth at any frame rate.
+    """
+    if world.game_over:
+        alpha = 1.0  # Ticks stop at game over, so the previous positions are never caught up
+    player = world.player
+    if renderer is not None:
+        renderer.clear(screen)
+    elif background is not None:
+        background.draw(screen, world.tick - 1 + alpha,
+                        lerp(player.last_x, player.x, alpha), lerp(player.last_y, player.y, alpha))
+    else:
+        screen.fill(BACKGROUND)
+    dirty = []
+    
+    # Draw stars
+    dirty.extend(world.stars.draw(screen, world.tick))
+    
+    # Draw obstacles
+    dirty.extend(world.obstacles.draw(screen, alpha))
+    
+    # Draw particles
+    dirty.append(world.particles.draw(screen))
+    
+    # Draw projectiles
+    dirty.extend(world.projectiles.draw(screen, alpha))
+    
+    # Draw player
+    dirty.append(player.draw(screen, alpha))
+    world.profiler.lap("draw")
+    
+    # Draw UI
+    dirty.extend(hud.draw(screen, world))
+    world.profiler.lap("hud")
+    return dirty
+
+def warm_sprite_cache():
+    """Pre-render the player and flame trail sprites so the first frames don't stall on them"""
+    player = Player(WIDTH // 2, HEIGHT // 2)
+    for angle in (0, math.pi / 2, math.pi, -math.pi / 2):
+        player.angle = angle
+        for flame_size in range(4, 13):  # Every size the jetpack flicker produces
+            sprite_cache.get(('player', angle, flame_size), PLAYER_SPRITE_SIZE,
+                             lambda surface, cx, cy: player.render(surface, cx, cy, flame_size))
+    for life in range(1, FLAME_LIFE + 1):
+        FlameTrail.sprite(life)
+
+class WarmUp:
+    """Loads fonts, the backdrop, the leaderboard and common sprites on a background thread
+    
+    Started once the window is open, so it appears straight away instead of
+    after everything the first frame needs has been loaded.
+    """
+    def __init__(self, leaderboard=True, parallax=True):
+        self.fonts = {}  # Point size -> default font
+        self.background = None
+        self.leaderboard = None
+        self.error = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(leaderboard, parallax),
+                                        name="warm-up", daemon=True)
+        self._thread.start()
+
+    def _run(self, leaderboard, parallax):
+        try:
+            for size in (22, 36, 72):
+                self.fonts[size] = pygame.font.Font(None, size)
+            self.background = Background(parallax)
+            if leaderboard:
+                self.leaderboard = Leaderboard()
+            warm_sprite_cache()
+        except Exception as error:
+            self.error = error
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """Return whether loading has finished, re-raising anything it failed with"""
+        if not self._done.wait(timeout):
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+def main(argv=None, on_tick=None):
+    """Run the game window; on_tick, if given, is called with the world after every tick"""
+    started = time.perf_counter()
+    parser = argparse.ArgumentParser(description="Star Collector")
+    parser.add_argument("--seed", type=int, help="seed for this session's random events")
+    parser.add_argument("--record", metavar="FILE", help="record this session to a replay file")
+    parser.add_argument("--replay", metavar="FILE", help="play back a recorded replay file")
+    parser.add_argument("--headless", action="store_true",
+                        help="with --replay, run without a window as fast as possible")
+    parser.add_argument("--profile", action="store_true",
+                        help="show the frame-time overlay on start (toggle with F3)")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="write per-frame phase timings to a CSV or .jsonl file")
+    parser.add_argument("--hard", action="store_true",
+                        help="hard mode: a swarm of hundreds of comets")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only redraw and update the parts of the screen that changed")
+    parser.add_argument("--max-fps", type=int,
+                        help=f"render frame cap, 0 for uncapped (default {FPS}, or 0 with --vsync)")
+    parser.add_argument("--vsync", action="store_true", help="sync rendering to the display")
+    parser.add_argument("--quality", choices=["auto"] + [level[0] for level in QUALITY_LEVELS],
+                        default="auto", help="render detail, or auto to adapt it to the frame time "
+                                             "(default auto)")
+    parser.add_argument("--rewind", type=float, default=REWIND_SECONDS, metavar="SECONDS",
+                        help=f"history kept for rewinding with Backspace, 0 to turn it off "
+                             f"(default {REWIND_SECONDS}; always off with --record)")
+    capture_group = parser.add_mutually_exclusive_group()
+    capture_group.add_argument("--capture", metavar="FILE",
+                               help="record every frame shown, as raw RGB frames or, for a .png "
+                                    "name, a numbered PNG sequence")
+    capture_group.add_argument("--capture-pipe", metavar="COMMAND",
+                               help="pipe every frame shown as raw RGB to an encoder's stdin")
+    args = parser.parse_args(argv)
+    if args.hard and (args.record or args.replay):
+        parser.error("replays only support the normal game mode")
+
+    if args.replay and args.headless:
+        seed, inputs = read_replay(args.replay)
+        start = time.perf_counter()
+        world = run_replay(seed, inputs)
+        elapsed = time.perf_counter() - start
+        print(f"Replayed {len(inputs)} ticks in {elapsed:.3f}s "
+              f"({len(inputs) / max(elapsed, 1e-9):.0f} ticks/s): "
+              f"score {world.score}, game over {world.game_over}")
+        return
+
+    # Only the subsystems the game uses; audio and joysticks are never opened
+    pygame.display.init()
+    pygame.font.init()
+    screen = None
+    if args.vsync:
+        try:
+            screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED, vsync=1)
+        except pygame.error:
+            pass  # No vsync support, fall back to the frame cap
+    if screen is None:
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    max_fps = args.max_fps if args.max_fps is not None else (0 if args.vsync else FPS)
+    pygame.display.set_caption("🌟 Star Collector - Use Arrow Keys or WASD!")
+    screen.fill(BACKGROUND)
+    pygame.display.flip()
+    startup = {"window": (time.perf_counter() - started) * 1000}
+    
+    # The backdrop stays still with dirty rects, since scrolling it would dirty the whole screen
+    warm_up = WarmUp(leaderboard=not args.replay, parallax=not args.dirty_rects)
+    while not warm_up.wait(0.01):
+        pygame.event.pump()  # Keep the window responsive while loading
+    startup["ready"] = (time.perf_counter() - started) * 1000
+    clock = pygame.time.Clock()
+    leaderboard = warm_up.leaderboard
+    hud = Hud(warm_up.fonts[36], warm_up.fonts[72], leaderboard)
+    background = warm_up.background
+    renderer = DirtyRectRenderer(background) if args.dirty_rects else None
+    capture = None
+    if args.capture or args.capture_pipe:
+        try:
+            capture = FrameCapture(screen, args.capture, args.capture_pipe)
+        except (OSError, ValueError) as error:
+            parser.error(f"can't capture frames: {error}")
+    
+    # Game state
+    replay_inputs = None
+    replay_position = 0
+    if args.replay:
+        seed, replay_inputs = read_replay(args.replay)
+        world = World(seed=seed)
+    elif args.hard:
+        world = World(leaderboard.high_score, max_obstacles=HARD_MODE_MAX_OBSTACLES, seed=args.seed,
+                      obstacle_spawn_rate=HARD_MODE_OBSTACLE_SPAWN_RATE, swarm=True)
+    else:
+        world = World(leaderboard.high_score, seed=args.seed)
+    recorder = ReplayWriter(args.record, world.seed) if args.record else None
+    # A recording can't be rewound, since its inputs have already been written
+    rewind = RewindBuffer(args.rewind) if args.rewind > 0 and not recorder else None
+    rewinding = False
+    # Rewinding or loading a save can bring a finished game back, so note which were scored
+    scored_games = set()
+    quicksave = None
+    save_thread = None
+    profiler = world.profiler = FrameProfiler(args.profile_out)
+    profiler.startup = startup
+    overlay = ProfilerOverlay(profiler, visible=args.profile, font=warm_up.fonts[22], rewind=rewind)
+    profiler.enabled = overlay.visible or args.profile_out is not None
+    input_state = InputState()
+    scaler = None
+    if args.quality == "auto":
+        # Uncapped rendering still aims for one frame per simulation tick
+        scaler = QualityScaler(1000 / (max_fps or FPS))
+    else:
+        quality.set_level([level[0] for level in QUALITY_LEVELS].index(args.quality))
+    
+    # Main game loop: the simulation runs in fixed ticks of 1/FPS seconds while
+    # rendering happens as often as the frame cap allows
+    tick_seconds = 1 / FPS
+    accumulator = 0.0
+    running = True
+    while running:
+        accumulator += min(clock.tick(max_fps) / 1000, MAX_FRAME_TIME)
+        frame_start = time.perf_counter()
+        profiler.begin_frame()
         
-        pygame.display.flip()
+        # Handle events
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_r and world.game_over:
+                # Restart game
+                input_state.press(INPUT_RESTART)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                overlay.toggle()
+                profiler.enabled = overlay.visible or args.profile_out is not None
+                profiler.begin_frame()
+            elif event.type in (pygame.KEYDOWN, pygame.KEYUP) and event.key == pygame.K_BACKSPACE:
+                rewinding = event.type == pygame.KEYDOWN and rewind is not None
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                quicksave = world.snapshot()
+                # Written on its own thread so the frame never waits on disk
+                if save_thread:
+                    save_thread.join()
+                save_thread = threading.Thread(target=write_atomic, name="quick-save", daemon=True,
+                                               args=(QUICKSAVE_FILE, pack_snapshot(quicksave)))
+                save_thread.start()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F9 and not (args.replay or recorder):
+                # Loading would desync a replay, whether it is being played or recorded
+                try:
+                    if quicksave is None:
+                        with open(QUICKSAVE_FILE, "rb") as f:
+                            quicksave = unpack_snapshot(f.read())
+                    world.restore(quicksave)
+                except (OSError, ValueError):
+                    quicksave = None  # No usable quick-save
+                else:
+                    if rewind:
+                        rewind.clear()
+            else:
+                if event.type == pygame.WINDOWFOCUSLOST:
+                    rewinding = False  # The key release won't be delivered
+                input_state.handle(event)
+        profiler.lap("events")
+        
+        while accumulator >= tick_seconds:
+            accumulator -= tick_seconds
+            if rewinding:
+                # Holding the rewind key runs the game backwards instead
+                rewound = rewind.rewind(world, REWIND_SPEED)
+                if replay_inputs is not None:
+                    replay_position -= rewound
+                input_state.consume()  # Keys pressed while rewinding don't carry over
+            elif replay_inputs is not None:
+                # Playback: inputs come from the file until it runs out
+                if replay_position < len(replay_inputs):
+                    if rewind:
+                        rewind.record(world, replay_inputs[replay_position])
+                    world.step(replay_inputs[replay_position])
+                    replay_position += 1
+            else:
+                inputs = input_state.consume()
+                if recorder:
+                    recorder.record(inputs)
+                if rewind:
+                    rewind.record(world, inputs)
+                was_over = world.game_over
+                world.step(inputs)
+                game_key = (world.seed, world.game_number)
+                if world.game_over and not was_over and game_key not in scored_games:
+                    scored_games.add(game_key)
+                    # Saved on the leaderboard's thread so the frame never waits on disk
+                    leaderboard.submit(world.score)
+            if on_tick:
+                on_tick(world)
+        
+        dirty = draw_world(screen, world, hud, renderer, accumulator / tick_seconds, background)
+        dirty.append(overlay.draw(screen))
+        if scaler:
+            scaler.record((time.perf_counter() - frame_start) * 1000)
+        profiler.lap("overlay")
+        if renderer:
+            renderer.present(dirty, full=world.game_over)
+        else:
+            pygame.display.flip()
+        profiler.lap("flip")
+        if capture:
+            capture.capture(screen)
+        profiler.lap("capture")
+        profiler.end_frame(world)
+        if "first frame" not in startup:
+            startup["first frame"] = (time.perf_counter() - started) * 1000
     
+    if recorder:
+        recorder.close()
+    if save_thread:
+        save_thread.join()
+    if capture:
+        print(capture.close())
+    if leaderboard:
+        leaderboard.close()
+    profiler.close()
     pygame.quit()
 
 if __name__ == "__main__":
     main()
-
-
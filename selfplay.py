@@ -0,0 +1,179 @@
+"""Headless batch self-play for tuning game settings across all CPU cores.
+
+Example:
+    python selfplay.py --policy seek --episodes 50 --player-speed 4,5,6 --out report.json
+"""
+import os
+import json
+import time
+import random
+import argparse
+import itertools
+import statistics
+import multiprocessing
+
+# Workers never open a window or play sound
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import game
+
+# Settings that can be swept, mapped to their World keyword, default and value type.
+# The cooldown counts whole ticks; everything else may be fractional.
+TUNABLES = {
+    "star_spawn_rate": (game.STAR_SPAWN_RATE, float),
+    "obstacle_spawn_rate": (game.OBSTACLE_SPAWN_RATE, float),
+    "player_speed": (game.PLAYER_SPEED, float),
+    "shoot_cooldown": (game.SHOOT_COOLDOWN, int),
+}
+DANGER_RADIUS = 120  # Distance at which the seek policy starts fleeing a comet
+
+class RandomPolicy:
+    """Holds a random direction for a while, then picks another"""
+    def __init__(self, rng, change_rate=0.05):
+        self.rng = rng
+        self.change_rate = change_rate
+        self.inputs = 0
+
+    def __call__(self, world):
+        if self.rng.random() < self.change_rate:
+            self.inputs = self.rng.randrange(16)
+        return self.inputs
+
+class SeekPolicy:
+    """Heads for the nearest star and flees any comet that gets too close"""
+    def __init__(self, rng):
+        self.rng = rng
+
+    def __call__(self, world):
+        player = world.player
+        target_x, target_y = player.x, player.y
+        threat = None
+        threat_distance = DANGER_RADIUS
+        comet_x, comet_y, _ = world.obstacles.circles()
+        for x, y in zip(comet_x.tolist(), comet_y.tolist()):
+            distance = ((x - player.x) ** 2 + (y - player.y) ** 2) ** 0.5
+            if distance < threat_distance:
+                threat, threat_distance = (x, y), distance
+        if threat is not None:
+            # Move directly away from the closest comet
+            target_x = player.x + (player.x - threat[0])
+            target_y = player.y + (player.y - threat[1])
+        elif len(world.stars):
+            star_x, star_y = world.stars.positions()
+            target_x, target_y = min(zip(star_x.tolist(), star_y.tolist()),
+                                     key=lambda s: (s[0] - player.x) ** 2 + (s[1] - player.y) ** 2)
+        inputs = 0
+        if target_x < player.x - player.speed:
+            inputs |= game.INPUT_LEFT
+        elif target_x > player.x + player.speed:
+            inputs |= game.INPUT_RIGHT
+        if target_y < player.y - player.speed:
+            inputs |= game.INPUT_UP
+        elif target_y > player.y + player.speed:
+            inputs |= game.INPUT_DOWN
+        return inputs
+
+POLICIES = {"random": RandomPolicy, "seek": SeekPolicy}
+
+def run_episode(task):
+    """Play one game to game over or max_ticks and return its stats"""
+    settings, policy_name, seed, max_ticks = task
+    world = game.World(seed=seed, **settings)
+    policy = POLICIES[policy_name](random.Random(seed ^ 0x5EED))
+    start = time.perf_counter()
+    while world.tick < max_ticks and not world.game_over:
+        world.step(policy(world))
+    elapsed = time.perf_counter() - start
+    return {
+        "settings": settings,
+        "seed": seed,
+        "survival_ticks": world.tick,
+        "survived": not world.game_over,
+        "score": world.score,
+        "ticks_per_sec": world.tick / max(elapsed, 1e-9),
+    }
+
+def summarize(settings, episodes):
+    """Aggregate the episodes played with one settings combination"""
+    survival = sorted(e["survival_ticks"] / game.FPS for e in episodes)
+    scores = sorted(e["score"] for e in episodes)
+    deciles = statistics.quantiles(scores, n=10, method="inclusive") if len(scores) > 1 else [scores[0]] * 9
+    return {
+        "settings": settings,
+        "episodes": len(episodes),
+        "survival_mean_s": statistics.fmean(survival),
+        "survival_median_s": statistics.median(survival),
+        "survived_rate": sum(e["survived"] for e in episodes) / len(episodes),
+        "score_mean": statistics.fmean(scores),
+        "score_p10": deciles[0],
+        "score_median": statistics.median(scores),
+        "score_p90": deciles[-1],
+        "score_max": scores[-1],
+        "ticks_per_sec": statistics.fmean(e["ticks_per_sec"] for e in episodes),
+    }
+
+def run_batch(grid, policy="seek", episodes=20, max_ticks=60 * game.FPS, workers=None, base_seed=0):
+    """Play every settings combination in grid and return (summaries, wall seconds, total ticks)"""
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    # Every combination sees the same seeds so they are compared on identical workloads
+    tasks = [(settings, policy, base_seed + episode, max_ticks)
+             for settings in combos for episode in range(episodes)]
+    workers = workers or os.cpu_count()
+    # Several chunks per worker keeps them all busy without much IPC overhead
+    chunksize = max(1, len(tasks) // (workers * 8))
+    results = {}
+    start = time.perf_counter()
+    # Spawned workers start clean instead of inheriting pygame state across fork()
+    pool = multiprocessing.get_context("spawn").Pool(workers)
+    try:
+        for episode in pool.imap_unordered(run_episode, tasks, chunksize):
+            key = tuple(episode["settings"][name] for name in names)
+            results.setdefault(key, []).append(episode)
+    finally:
+        # SDL swallows SIGTERM, so let workers exit on their own rather than terminate()
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+    summaries = [summarize(dict(zip(names, key)), results[key]) for key in sorted(results)]
+    total_ticks = sum(e["survival_ticks"] for group in results.values() for e in group)
+    return summaries, elapsed, total_ticks
+
+def parse_values(text, cast):
+    return [cast(value) for value in text.split(",")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch self-play")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="seek")
+    parser.add_argument("--episodes", type=int, default=20, help="games per settings combination")
+    parser.add_argument("--ticks", type=int, default=60 * game.FPS, help="tick limit per game")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    parser.add_argument("--out", metavar="FILE", help="write the full report as JSON")
+    for name, (default, _) in TUNABLES.items():
+        parser.add_argument("--" + name.replace("_", "-"), default=str(default),
+                            help=f"comma-separated values to sweep (default {default})")
+    args = parser.parse_args(argv)
+
+    grid = {name: parse_values(getattr(args, name), cast) for name, (_, cast) in TUNABLES.items()}
+    summaries, elapsed, total_ticks = run_batch(grid, args.policy, args.episodes, args.ticks,
+                                                args.workers, args.seed)
+
+    for summary in summaries:
+        settings = " ".join(f"{name}={value}" for name, value in summary["settings"].items())
+        print(f"{settings}: survival {summary['survival_mean_s']:.1f}s "
+              f"score {summary['score_mean']:.1f} (p10 {summary['score_p10']:.0f}, "
+              f"p90 {summary['score_p90']:.0f}) {summary['ticks_per_sec']:.0f} ticks/s")
+    print(f"{len(summaries)} combinations, {total_ticks} ticks in {elapsed:.1f}s "
+          f"({total_ticks / max(elapsed, 1e-9):.0f} ticks/s overall)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"policy": args.policy, "episodes": args.episodes, "max_ticks": args.ticks,
+                       "elapsed_s": elapsed, "total_ticks": total_ticks,
+                       "results": summaries}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
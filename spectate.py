@@ -0,0 +1,583 @@
+"""Spectator server and client for watching a game over the network.
+
+The host is authoritative: after every tick it captures the world and sends
+it to each spectator over UDP. Snapshots are binary-packed and delta-encoded
+against the last snapshot that spectator acknowledged, so a lost datagram
+only makes the next one larger. Spectators render a little behind the
+newest snapshot and interpolate between the two around that time.
+
+Example:
+    python spectate.py host --port 5999 [game options]   # play, and let others watch
+    python spectate.py watch --port 5999                 # watch from another window
+    python spectate.py loopback --clients 32 --hard      # measure bytes and CPU per spectator
+"""
+import os
+import sys
+import time
+import random
+import struct
+import asyncio
+import argparse
+import threading
+from collections import OrderedDict
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import numpy as np
+import game
+
+DEFAULT_PORT = 5999
+SNAPSHOT_MAGIC = b"SCSN"
+ACK_MAGIC = b"SCAK"
+PROTOCOL_VERSION = 1
+# Snapshot header: magic, version, frame, baseline frame, world tick, score, high score,
+# flags, player x and y; then the star, comet and shot tables
+SNAPSHOT_HEADER = struct.Struct("<4sBIIIIIBhh")
+# Spectator to host: magic and the newest frame received (NO_BASELINE to join)
+ACK = struct.Struct("<4sI")
+NO_BASELINE = 0xFFFFFFFF
+FLAG_GAME_OVER = 1
+POSITION_SCALE = 8  # Positions are sent in 1/8 pixel steps
+HISTORY_FRAMES = 64  # Snapshots kept on both sides to encode and decode deltas against
+SPECTATOR_TIMEOUT = 5.0  # Seconds without an ack before a spectator is dropped
+HELLO_INTERVAL = 1.0  # Seconds between join requests while no snapshot has arrived
+INTERPOLATION_DELAY = 2  # Ticks spectators render behind the newest snapshot
+
+# Entity tables in the order they are packed, with the fields of each entity
+TABLES = ("stars", "comets", "shots")
+TABLE_FIELDS = {
+    "stars": ("x", "y", "color"),
+    "comets": ("x", "y", "rotation", "variant"),
+    "shots": ("x", "y"),
+}
+NEW_ENTITY = 0x80  # Field mask bit: every field is sent whole rather than as a change
+
+def write_varint(out, value):
+    """Append a non-negative int in LEB128 form: 7 bits per byte, high bit set until the last"""
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def write_signed(out, value):
+    # Zigzag mapping keeps small negative changes in one byte: 0, -1, 1, -2 -> 0, 1, 2, 3
+    write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+def read_signed(data, offset):
+    value, offset = read_varint(data, offset)
+    return (value >> 1) ^ -(value & 1), offset
+
+class Snapshot:
+    """One tick of the game as spectators see it, with entities keyed by id in each table"""
+    __slots__ = ('frame', 'tick', 'score', 'high_score', 'game_over', 'player', 'tables')
+
+    def __init__(self, frame, tick, score, high_score, game_over, player, tables):
+        self.frame = frame
+        self.tick = tick
+        self.score = score
+        self.high_score = high_score
+        self.game_over = game_over
+        self.player = player  # (x, y) in POSITION_SCALE units
+        self.tables = tables  # Table name -> {entity id: tuple of field values}
+
+    def same_state(self, other):
+        return (self.tick, self.score, self.high_score, self.game_over, self.player, self.tables) == \
+               (other.tick, other.score, other.high_score, other.game_over, other.player, other.tables)
+
+EMPTY_TABLES = {name: {} for name in TABLES}
+
+class SnapshotCapture:
+    """Turns the world into a Snapshot after each tick; runs on the game's thread"""
+    def __init__(self):
+        self.frame = 0
+
+    def capture(self, world):
+        self.frame += 1
+        scale = POSITION_SCALE
+        # Every entity has a serial that lasts while it stays in the world, used as its network id
+        store = world.stars.store
+        n = store.count
+        stars = {serial: (x * scale, y * scale, color)
+                 for serial, x, y, color in zip(store.serial[:n].tolist(), store.x[:n].tolist(),
+                                                store.y[:n].tolist(), store.color[:n].tolist())}
+        store = world.obstacles.store
+        n = store.count
+        # A comet with a shape of its own is sent as one of the shared swarm variants
+        variants = np.where(store.shape[:n] < 0, -1 - store.shape[:n],
+                            store.shape[:n] % game.SWARM_SHAPE_VARIANTS)
+        comets = {serial: (round(x * scale), round(y * scale), rotation % 360, variant)
+                  for serial, x, y, rotation, variant in zip(
+                      store.serial[:n].tolist(), store.x[:n].tolist(), store.y[:n].tolist(),
+                      store.rotation[:n].tolist(), variants.tolist())}
+        store = world.projectiles.store
+        n = store.count
+        shots = {serial: (round(x * scale), round(y * scale))
+                 for serial, x, y in zip(store.serial[:n].tolist(), store.x[:n].tolist(), store.y[:n].tolist())}
+        player = world.player
+        return Snapshot(self.frame, world.tick, world.score, world.high_score, world.game_over,
+                        (round(player.x * scale), round(player.y * scale)),
+                        {"stars": stars, "comets": comets, "shots": shots})
+
+def encode(snapshot, baseline=None):
+    """Pack a snapshot as the changes since baseline, or whole when there is none"""
+    out = bytearray(SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, PROTOCOL_VERSION, snapshot.frame,
+        NO_BASELINE if baseline is None else baseline.frame, snapshot.tick, snapshot.score,
+        snapshot.high_score, FLAG_GAME_OVER if snapshot.game_over else 0, *snapshot.player))
+    base_tables = EMPTY_TABLES if baseline is None else baseline.tables
+    for name in TABLES:
+        table, base = snapshot.tables[name], base_tables[name]
+        # Ids are sorted and sent as the gap from the previous one
+        removed = sorted(key for key in base if key not in table)
+        write_varint(out, len(removed))
+        previous = 0
+        for key in removed:
+            write_varint(out, key - previous)
+            previous = key
+        changed = sorted((key, values) for key, values in table.items() if base.get(key) != values)
+        write_varint(out, len(changed))
+        previous = 0
+        for key, values in changed:
+            write_varint(out, key - previous)
+            previous = key
+            old = base.get(key)
+            if old is None:
+                out.append(NEW_ENTITY)
+                for value in values:
+                    write_signed(out, value)
+                continue
+            mask = 0
+            for bit, (value, old_value) in enumerate(zip(values, old)):
+                if value != old_value:
+                    mask |= 1 << bit
+            out.append(mask)
+            for value, old_value in zip(values, old):
+                if value != old_value:
+                    write_signed(out, value - old_value)
+    return bytes(out)
+
+def decode(data, baselines):
+    """Unpack a snapshot given the frames decoded so far; None if its baseline is unknown"""
+    (magic, version, frame, baseline_frame, tick, score, high_score, flags,
+     player_x, player_y) = SNAPSHOT_HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != PROTOCOL_VERSION:
+        raise ValueError("not a spectator snapshot")
+    if baseline_frame == NO_BASELINE:
+        base_tables = EMPTY_TABLES
+    elif baseline_frame in baselines:
+        base_tables = baselines[baseline_frame].tables
+    else:
+        return None
+    offset = SNAPSHOT_HEADER.size
+    tables = {}
+    for name in TABLES:
+        table = dict(base_tables[name])
+        count, offset = read_varint(data, offset)
+        key = 0
+        for _ in range(count):
+            gap, offset = read_varint(data, offset)
+            key += gap
+            del table[key]
+        count, offset = read_varint(data, offset)
+        key = 0
+        for _ in range(count):
+            gap, offset = read_varint(data, offset)
+            key += gap
+            mask = data[offset]
+            offset += 1
+            values = []
+            old = table.get(key)
+            for bit in range(len(TABLE_FIELDS[name])):
+                if mask & NEW_ENTITY:
+                    value, offset = read_signed(data, offset)
+                elif mask & 1 << bit:
+                    change, offset = read_signed(data, offset)
+                    value = old[bit] + change
+                else:
+                    value = old[bit]
+                values.append(value)
+            table[key] = tuple(values)
+        tables[name] = table
+    return Snapshot(frame, tick, score, high_score, bool(flags & FLAG_GAME_OVER),
+                    (player_x, player_y), tables)
+
+class Spectator:
+    __slots__ = ('address', 'acked', 'last_seen', 'bytes_sent')
+
+    def __init__(self, address, now):
+        self.address = address
+        self.acked = NO_BASELINE  # Newest frame the spectator has confirmed
+        self.last_seen = now
+        self.bytes_sent = 0
+
+class SpectatorServer(asyncio.DatagramProtocol):
+    """Sends every published snapshot to each spectator, as a delta from its last ack
+
+    Spectators that acked the same frame share one encoding, so the cost
+    of a crowd that keeps up is close to the cost of one spectator.
+    """
+    def __init__(self):
+        self.transport = None
+        self.spectators = {}  # Address -> Spectator
+        self.history = OrderedDict()  # Frame -> Snapshot, newest last
+        # Totals for the report
+        self.frames = 0
+        self.bytes_sent = 0
+        self.deliveries = 0  # Snapshots sent, summed over spectators
+        self.cpu_seconds = 0.0  # Thread CPU time spent encoding and sending
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if len(data) != ACK.size:
+            return
+        magic, frame = ACK.unpack(data)
+        if magic != ACK_MAGIC:
+            return
+        spectator = self.spectators.get(address)
+        if spectator is None:
+            spectator = self.spectators[address] = Spectator(address, time.monotonic())
+        spectator.last_seen = time.monotonic()
+        # Acks can arrive out of order; a baseline only ever moves forward
+        if frame == NO_BASELINE or spectator.acked == NO_BASELINE or frame > spectator.acked:
+            spectator.acked = frame
+
+    def broadcast(self, snapshot):
+        """Send a snapshot to every spectator; runs on the event loop"""
+        started = time.thread_time()
+        history = self.history
+        history[snapshot.frame] = snapshot
+        while len(history) > HISTORY_FRAMES:
+            history.popitem(last=False)
+        now = time.monotonic()
+        encoded = {}  # Baseline frame -> packed snapshot
+        for address, spectator in list(self.spectators.items()):
+            if now - spectator.last_seen > SPECTATOR_TIMEOUT:
+                del self.spectators[address]
+                continue
+            baseline = history.get(spectator.acked)
+            key = None if baseline is None else baseline.frame
+            data = encoded.get(key)
+            if data is None:
+                data = encoded[key] = encode(snapshot, baseline)
+            self.transport.sendto(data, address)
+            spectator.bytes_sent += len(data)
+            self.bytes_sent += len(data)
+            self.deliveries += 1
+        self.frames += 1
+        self.cpu_seconds += time.thread_time() - started
+
+    def report(self):
+        """Bytes per tick and server CPU per spectator since the server started"""
+        deliveries = max(self.deliveries, 1)
+        return {
+            "spectators": len(self.spectators),
+            "frames": self.frames,
+            "bytes_per_tick": self.bytes_sent / max(self.frames, 1),
+            "bytes_per_spectator_tick": self.bytes_sent / deliveries,
+            "cpu_us_per_spectator_tick": self.cpu_seconds * 1e6 / deliveries,
+        }
+
+class SpectatorHost:
+    """Runs a SpectatorServer on its own thread and feeds it from the game's tick callback"""
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT):
+        self.server = SpectatorServer()
+        self.capture = SnapshotCapture()
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(host, port, ready),
+                                        name="spectator-server", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def _run(self, host, port, ready):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(
+            self.loop.create_datagram_endpoint(lambda: self.server, local_addr=(host, port)))
+        ready.set()
+        self.loop.run_forever()
+
+    def publish(self, world):
+        """Capture the world on the calling thread and queue it for sending"""
+        snapshot = self.capture.capture(world)
+        self.loop.call_soon_threadsafe(self.server.broadcast, snapshot)
+
+    def close(self):
+        def stop():
+            if self.server.transport is not None:
+                self.server.transport.close()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(stop)
+        self._thread.join()
+
+class SpectatorClient(asyncio.DatagramProtocol):
+    """Receives snapshots, acks each one, and keeps recent ones for decoding and interpolation"""
+    def __init__(self, drop_rate=0.0, rng=None):
+        self.transport = None
+        self.snapshots = OrderedDict()  # Frame -> Snapshot, oldest first
+        self.arrivals = {}  # Frame -> time.perf_counter() when it arrived
+        self.latest = None
+        self.received = 0  # Snapshots decoded
+        self.received_bytes = 0
+        self.undecodable = 0  # Snapshots whose baseline had already been dropped here
+        self.drop_rate = drop_rate  # Simulated packet loss for the loopback test
+        self.rng = rng or random.Random()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.hello()
+
+    def hello(self):
+        self.transport.sendto(ACK.pack(ACK_MAGIC, NO_BASELINE))
+
+    def datagram_received(self, data, address):
+        if self.drop_rate and self.rng.random() < self.drop_rate:
+            return
+        self.received_bytes += len(data)
+        try:
+            snapshot = decode(data, self.snapshots)
+        except (ValueError, KeyError, IndexError, struct.error):
+            return  # Not a snapshot, or a corrupt one
+        if snapshot is None:
+            self.undecodable += 1
+            return
+        if self.latest is not None and snapshot.frame <= self.latest.frame:
+            return  # Reordered or duplicated
+        self.snapshots[snapshot.frame] = snapshot
+        self.arrivals[snapshot.frame] = time.perf_counter()
+        while len(self.snapshots) > HISTORY_FRAMES:
+            frame, _ = self.snapshots.popitem(last=False)
+            del self.arrivals[frame]
+        self.latest = snapshot
+        self.received += 1
+        self.transport.sendto(ACK.pack(ACK_MAGIC, snapshot.frame))
+
+    def interpolation_pair(self, now):
+        """Return (older, newer, alpha) around INTERPOLATION_DELAY ticks before now"""
+        latest = self.latest
+        if latest is None:
+            return None
+        # Place the newest frame at its arrival time and step back in ticks from there
+        target = latest.frame + (now - self.arrivals[latest.frame]) * game.FPS - INTERPOLATION_DELAY
+        older = newer = latest
+        for frame, snapshot in reversed(self.snapshots.items()):
+            if frame <= target:
+                older = snapshot
+                break
+            newer = snapshot
+        else:
+            older = newer  # Everything kept is newer than the target, so hold the oldest
+        if newer.frame == older.frame:
+            return older, newer, 1.0
+        alpha = (target - older.frame) / (newer.frame - older.frame)
+        return older, newer, min(max(alpha, 0.0), 1.0)
+
+class SpectatorView:
+    """Game objects rebuilt from snapshots and drawn with the game's own sprites"""
+    def __init__(self, hud, background):
+        self.hud = hud
+        self.background = background
+        self.stars = {}  # Network id -> [rotation, pulse], advanced at the display rate
+        self.player = game.Player(game.WIDTH // 2, game.HEIGHT // 2)
+        self.player_frame = None  # Newest frame the player has been moved to
+        self.player_tick = None  # World tick of that frame
+        self.score = 0
+        self.high_score = 0
+        self.game_over = False
+
+    def draw(self, screen, client, older, newer, alpha):
+        scale = POSITION_SCALE
+        self._move_player(client, newer)
+        self.score, self.high_score, self.game_over = newer.score, newer.high_score, newer.game_over
+        player = self.player
+        self.background.draw(screen, newer.frame - 1 + alpha,
+                             game.lerp(player.last_x, player.x, alpha), game.lerp(player.last_y, player.y, alpha))
+
+        stars = newer.tables["stars"]
+        for key in list(self.stars):
+            if key not in stars:
+                del self.stars[key]
+        for key, (x, y, color) in stars.items():
+            spin = self.stars.setdefault(key, [0, 0])
+            # Spins and pulses at the display rate, like the game's own stars
+            spin[0] += game.STAR_SPIN
+            spin[1] += game.STAR_PULSE_RATE
+            game.draw_star(screen, x // scale, y // scale, color, *spin)
+
+        old_comets = older.tables["comets"]
+        for key, (x, y, rotation, variant) in newer.tables["comets"].items():
+            old_x, old_y, _, _ = old_comets.get(key, (x, y, rotation, variant))
+            # Only the shape family is sent, so spectators see one of the shared swarm shapes
+            game.CometShape.variant(variant).draw(screen, game.lerp(old_x, x, alpha) / scale,
+                                                  game.lerp(old_y, y, alpha) / scale, rotation)
+
+        old_shots = older.tables["shots"]
+        for key, (x, y) in newer.tables["shots"].items():
+            old_x, old_y = old_shots.get(key, (x, y))
+            center = (int(game.lerp(old_x, x, alpha) / scale), int(game.lerp(old_y, y, alpha) / scale))
+            pygame.draw.circle(screen, game.PROJECTILE_COLOR, center, game.PROJECTILE_SIZE)
+            pygame.draw.circle(screen, (255, 255, 255), center, game.PROJECTILE_SIZE, 1)
+
+        player.draw(screen, alpha)
+        self.hud.draw(screen, self)
+
+    def _move_player(self, client, snapshot):
+        """Replay the player's moves up to snapshot, so its facing and flame trail match the host"""
+        player = self.player
+        if self.player_frame is not None and snapshot.frame <= self.player_frame:
+            return
+        frames = [frame for frame in client.snapshots
+                  if self.player_frame is None or self.player_frame < frame <= snapshot.frame]
+        for frame in frames:
+            moved = client.snapshots[frame]
+            x, y = moved.player[0] / POSITION_SCALE, moved.player[1] / POSITION_SCALE
+            if self.player_tick is None or moved.tick < self.player_tick:
+                # Joining, or a new game: start from here without a trail
+                self.player = player = game.Player(x, y)
+            elif moved.tick > self.player_tick:
+                player.move(x - player.x, y - player.y)
+                player.x, player.y = x, y
+            self.player_tick = moved.tick
+        self.player_frame = snapshot.frame
+
+async def watch(host, port):
+    """Open a window that shows the game hosted at host:port"""
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    pygame.display.set_caption(f"🌟 Star Collector - watching {host}:{port}")
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(SpectatorClient, remote_addr=(host, port))
+    view = SpectatorView(game.Hud(pygame.font.Font(None, 36), pygame.font.Font(None, 72)), game.Background())
+    font = pygame.font.Font(None, 22)
+    clock = pygame.time.Clock()
+    last_hello = time.perf_counter()
+    try:
+        while not any(event.type == pygame.QUIT for event in pygame.event.get()):
+            now = time.perf_counter()
+            pair = client.interpolation_pair(now)
+            if pair is None:
+                if now - last_hello > HELLO_INTERVAL:
+                    client.hello()  # The host may not have been up yet
+                    last_hello = now
+                screen.fill(game.BACKGROUND)
+                screen.blit(font.render(f"Waiting for {host}:{port}...", True, game.TEXT_COLOR), (10, 10))
+            else:
+                view.draw(screen, client, *pair)
+            pygame.display.flip()
+            clock.tick(game.FPS)
+            await asyncio.sleep(0)  # Let the snapshots waiting on the socket in
+    finally:
+        transport.close()
+        pygame.quit()
+
+async def loopback(spectators, ticks, hard=False, drop_rate=0.0, seed=0):
+    """Host a scripted game at the normal tick rate with spectators on localhost
+    
+    Returns the server's report plus how much got through and whether every
+    snapshot a spectator decoded matches what the host captured.
+    """
+    import selfplay
+    loop = asyncio.get_running_loop()
+    server = SpectatorServer()
+    transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=("127.0.0.1", 0))
+    address = transport.get_extra_info("sockname")
+    clients = []
+    for i in range(spectators):
+        _, client = await loop.create_datagram_endpoint(
+            lambda: SpectatorClient(drop_rate, random.Random(seed + i)), remote_addr=address)
+        clients.append(client)
+    if hard:
+        world = game.World(seed=seed, max_obstacles=game.HARD_MODE_MAX_OBSTACLES,
+                           obstacle_spawn_rate=game.HARD_MODE_OBSTACLE_SPAWN_RATE, swarm=True)
+    else:
+        world = game.World(seed=seed)
+    policy = selfplay.SeekPolicy(random.Random(seed))
+    capture = SnapshotCapture()
+    await asyncio.sleep(0.05)  # Let the join requests arrive
+    sent = {}
+    full_bytes = 0
+    # Ticks are paced like the game's, so acks have the time they would have in play
+    next_tick = loop.time()
+    for _ in range(ticks):
+        world.step(policy(world) | (game.INPUT_RESTART if world.game_over else 0))
+        snapshot = capture.capture(world)
+        sent[snapshot.frame] = snapshot
+        full_bytes += len(encode(snapshot))
+        server.broadcast(snapshot)
+        next_tick += 1 / game.FPS
+        await asyncio.sleep(max(next_tick - loop.time(), 0))
+    await asyncio.sleep(0.05)
+    mismatches = sum(not client.snapshots[frame].same_state(sent[frame])
+                     for client in clients for frame in client.snapshots)
+    report = server.report()
+    report.update({
+        "full_bytes_per_tick": full_bytes / max(ticks, 1),
+        "received_rate": sum(client.received for client in clients) / max(spectators * ticks, 1),
+        "undecodable": sum(client.undecodable for client in clients),
+        "mismatches": mismatches,
+    })
+    transport.close()
+    for client in clients:
+        client.transport.close()
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spectator server and client")
+    commands = parser.add_subparsers(dest="command", required=True)
+    host = commands.add_parser("host", help="play the game and let spectators watch it",
+                               epilog="Any other options are passed on to the game.")
+    host.add_argument("--bind", default="127.0.0.1", help="address to listen on")
+    host.add_argument("--port", type=int, default=DEFAULT_PORT)
+    watch_parser = commands.add_parser("watch", help="watch a hosted game")
+    watch_parser.add_argument("--host", default="127.0.0.1")
+    watch_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    test = commands.add_parser("loopback", help="measure a scripted game with local spectators")
+    test.add_argument("--clients", type=int, default=32)
+    test.add_argument("--ticks", type=int, default=600)
+    test.add_argument("--hard", action="store_true", help="hard mode's comet swarm")
+    test.add_argument("--drop", type=float, default=0.0, help="fraction of snapshots each spectator loses")
+    test.add_argument("--seed", type=int, default=0)
+    args, game_args = parser.parse_known_args(argv)
+
+    if args.command == "host":
+        spectator_host = SpectatorHost(args.bind, args.port)
+        print(f"Hosting spectators on {args.bind}:{args.port}")
+        try:
+            game.main(game_args, on_tick=spectator_host.publish)
+        finally:
+            spectator_host.close()
+            report = spectator_host.server.report()
+            print(f"{report['frames']} ticks, {report['bytes_per_tick']:.0f} bytes/tick to "
+                  f"{report['spectators']} spectators, {report['bytes_per_spectator_tick']:.0f} bytes and "
+                  f"{report['cpu_us_per_spectator_tick']:.1f}us CPU per spectator per tick")
+    elif game_args:
+        parser.error(f"unrecognized arguments: {' '.join(game_args)}")
+    elif args.command == "watch":
+        asyncio.run(watch(args.host, args.port))
+    else:
+        report = asyncio.run(loopback(args.clients, args.ticks, args.hard, args.drop, args.seed))
+        print(f"{args.clients} spectators, {args.ticks} ticks: "
+              f"{report['bytes_per_spectator_tick']:.0f} bytes per spectator per tick "
+              f"(whole snapshots: {report['full_bytes_per_tick']:.0f}), "
+              f"{report['bytes_per_tick']:.0f} bytes/tick in total, "
+              f"{report['cpu_us_per_spectator_tick']:.1f}us server CPU per spectator per tick")
+        print(f"received {report['received_rate']:.1%} of ticks, "
+              f"{report['undecodable']} undecodable, {report['mismatches']} mismatched snapshots")
+        return 1 if report["mismatches"] else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+"""Batched headless game instances for training and evaluating automated players.
+
+VecEnv runs N independent games in lockstep. Every entity lives in NumPy
+arrays of shape (N, slots), so one step() call advances all of them with
+whole-array operations. The rules are the ones World.step applies each tick:
+spawn chances and ranges, player movement and facing, the shoot cooldown,
+swept projectile hits, wall bounces, hitboxes, +10 per star, +5 per comet
+shot, and game over on touching a comet. Comets move with a fixed velocity
+vector that flips on a bounce, as in World's CometField. Random draws
+come from one NumPy generator for the whole batch, so a seed reproduces a
+batch but not the game World plays with the same seed.
+
+Example:
+    env = VecEnv(4096, seed=0)
+    obs = env.reset()
+    for _ in range(1000):
+        actions = policy(obs)  # (N,) INPUT_* bitmasks
+        obs, rewards, dones = env.step(actions | dones * game.INPUT_RESTART)
+
+    python vecenv.py --envs 4096 --ticks 1000   # measure agent-steps per second
+    python vecenv.py --envs 4096 --no-observe    # the same, without building observations
+"""
+import os
+import math
+import time
+import argparse
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import game
+
+# Facing directions the player can have, in the order of the lookup tables below
+HEADING_RIGHT, HEADING_LEFT, HEADING_UP, HEADING_DOWN = range(4)
+HEADING_ANGLES = (0, math.pi, -math.pi / 2, math.pi / 2)  # Player.angle for each heading
+# Computed with math like Player.shoot, so shots leave at exactly the same velocity
+HEADING_COS = np.array([math.cos(angle) for angle in HEADING_ANGLES])
+HEADING_SIN = np.array([math.sin(angle) for angle in HEADING_ANGLES])
+# Facing after a move, indexed by 3 * sign(dx) + sign(dy) + 4, with -1 to keep the current
+# one. Horizontal movement wins on diagonals
+TURN = np.array([HEADING_LEFT, HEADING_LEFT, HEADING_LEFT, HEADING_UP, -1, HEADING_DOWN,
+                 HEADING_RIGHT, HEADING_RIGHT, HEADING_RIGHT], dtype=np.int8)
+
+PLAYER_BODY_WIDTH, PLAYER_BODY_HEIGHT, PLAYER_BODY_TOP = 20, 30, 5  # Player.get_rect() box
+MAX_OBSTACLE_SPEED = 3  # Upper end of the comet speed range, used to scale observations
+# Furthest a shot's center can start from a comet's center and still touch it within one tick
+SHOT_REACH = game.PROJECTILE_SIZE + game.OBSTACLE_SIZE + game.PROJECTILE_SPEED
+
+def free_slots(alive, envs):
+    """First empty slot in each of the given rows, which must all have one"""
+    return alive[envs].argmin(axis=1)
+
+def within(values, centers, reach, out, scratch):
+    """Set out to |values - centers| < reach, using scratch for the distances, and return it"""
+    np.subtract(values, centers, out=scratch)
+    np.abs(scratch, out=scratch)
+    return np.less(scratch, reach, out=out)
+
+class VecEnv:
+    """N independent games stepped together, with entity state as (N, slots) arrays
+
+    New entities take the first empty slot of their row, so slots are not
+    in spawn order. Shots and comets record the tick they appeared on
+    instead, since World's spawn order decides which shot takes a comet
+    when two reach it in the same tick.
+
+    Observations are float32 arrays of shape (N, obs_size): the player's
+    position, facing and cooldown, then a column per star slot for each of
+    dx, dy and alive, then a column per comet slot for each of dx, dy, vx,
+    vy and alive. Offsets are relative to the player, and all values are
+    scaled to roughly [-1, 1]. The array is column-major and reused, so
+    step() overwrites the previous observation; copy it to keep it. With
+    observe=False, step() skips building observations and returns None in
+    their place.
+    """
+    def __init__(self, n, seed=None, max_stars=game.MAX_STARS, max_obstacles=game.MAX_OBSTACLES,
+                 star_spawn_rate=game.STAR_SPAWN_RATE, obstacle_spawn_rate=game.OBSTACLE_SPAWN_RATE,
+                 player_speed=game.PLAYER_SPEED, shoot_cooldown=game.SHOOT_COOLDOWN, observe=True):
+        self.n = n
+        self.seed = game.new_seed() if seed is None else seed
+        # One generator for the whole batch: the same seed and n replay the same games
+        self.rng = np.random.default_rng(self.seed)
+        self.max_stars = max_stars
+        self.max_obstacles = max_obstacles
+        self.star_spawn_rate = star_spawn_rate
+        self.obstacle_spawn_rate = obstacle_spawn_rate
+        self.player_speed = player_speed
+        self.shoot_cooldown = shoot_cooldown
+        # Enough slots for every shot that can be in flight before it expires
+        max_projectiles = game.PROJECTILE_LIFE // max(shoot_cooldown, 1) + 2
+        self.obs_size = 5 + 3 * max_stars + 5 * max_obstacles
+
+        # Player
+        self.player_x = np.zeros(n)
+        self.player_y = np.zeros(n)
+        self.heading = np.zeros(n, dtype=np.int8)  # HEADING_* index
+        self.cooldown = np.zeros(n, dtype=np.int32)  # Ticks until the next shot is allowed
+        self.score = np.zeros(n, dtype=np.int64)
+        self.high_score = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.tick = np.zeros(n, dtype=np.int64)
+
+        # Stars, comets and shots, one row per game. The arrays are column-major so each slot's
+        # column is contiguous, which keeps the inner loop N long when a slot array meets a
+        # per-game (N, 1) column, instead of restarting it every few slots
+        self.star_x = np.zeros((n, max_stars), order="F")
+        self.star_y = np.zeros((n, max_stars), order="F")
+        self.star_alive = np.zeros((n, max_stars), dtype=bool, order="F")
+        self.obstacle_x = np.zeros((n, max_obstacles), order="F")
+        self.obstacle_y = np.zeros((n, max_obstacles), order="F")
+        self.obstacle_vx = np.zeros((n, max_obstacles), order="F")
+        self.obstacle_vy = np.zeros((n, max_obstacles), order="F")
+        self.obstacle_radius = np.zeros((n, max_obstacles), order="F")
+        self.obstacle_alive = np.zeros((n, max_obstacles), dtype=bool, order="F")
+        # Tick each comet appeared on
+        self.obstacle_spawned = np.zeros((n, max_obstacles), dtype=np.int64, order="F")
+        self.shot_x = np.zeros((n, max_projectiles), order="F")
+        self.shot_y = np.zeros((n, max_projectiles), order="F")
+        self.shot_vx = np.zeros((n, max_projectiles), order="F")
+        self.shot_vy = np.zeros((n, max_projectiles), order="F")
+        self.shot_life = np.zeros((n, max_projectiles), dtype=np.int32, order="F")
+        self.shot_alive = np.zeros((n, max_projectiles), dtype=bool, order="F")
+        # Tick each shot was fired on
+        self.shot_fired = np.zeros((n, max_projectiles), dtype=np.int64, order="F")
+        # Scratch space for the player's contact tests, reused every step rather than
+        # allocating (and page-faulting) fresh temporaries of this size
+        slots = max(max_stars, max_obstacles)
+        self._distance = np.zeros((n, slots), order="F")
+        self._near_x = np.zeros((n, slots), dtype=bool, order="F")
+        self._near_y = np.zeros((n, slots), dtype=bool, order="F")
+
+        # Observations are written into one reused float32 buffer, column-major like the
+        # state. Each feature after the player's fills one column per slot: a state array
+        # minus an offset, times a precomputed scale, with empty slots zeroed by the alive
+        # mask. The alive flags themselves are copied as they are
+        self.observing = observe
+        self._obs = np.zeros((n, self.obs_size), dtype=np.float32, order="F")
+        px, py = self.player_x[:, None], self.player_y[:, None]
+        features = (
+            (self.star_x, px, 1 / game.WIDTH, self.star_alive),
+            (self.star_y, py, 1 / game.HEIGHT, self.star_alive),
+            (self.star_alive, None, None, None),
+            (self.obstacle_x, px, 1 / game.WIDTH, self.obstacle_alive),
+            (self.obstacle_y, py, 1 / game.HEIGHT, self.obstacle_alive),
+            (self.obstacle_vx, 0, 1 / MAX_OBSTACLE_SPEED, self.obstacle_alive),
+            (self.obstacle_vy, 0, 1 / MAX_OBSTACLE_SPEED, self.obstacle_alive),
+            (self.obstacle_alive, None, None, None),
+        )
+        self._features = []  # (observation columns, values, offset, scale, alive)
+        start = 5
+        for values, offset, scale, alive in features:
+            end = start + values.shape[1]
+            self._features.append((self._obs[:, start:end], values, offset, scale, alive))
+            start = end
+        self.reset()
+
+    def reset(self, mask=None):
+        """Start fresh games in the envs selected by a boolean (N,) mask (default: all)"""
+        self._new_games(np.ones(self.n, dtype=bool) if mask is None else mask)
+        return self.observe() if self.observing else None
+
+    def _new_games(self, mask):
+        self.player_x[mask] = game.WIDTH // 2
+        self.player_y[mask] = game.HEIGHT // 2
+        self.heading[mask] = HEADING_RIGHT
+        self.cooldown[mask] = 0
+        self.score[mask] = 0
+        self.game_over[mask] = False
+        self.tick[mask] = 0
+        self.star_alive[mask] = False
+        self.obstacle_alive[mask] = False
+        self.shot_alive[mask] = False
+
+    def step(self, actions):
+        """Advance every game one tick given (N,) INPUT_* bitmasks; return (obs, rewards, dones)
+
+        Finished games stay frozen with zero reward until reset() or an
+        action with INPUT_RESTART, which starts a new game on that tick.
+        """
+        actions = np.asarray(actions)
+        restart = self.game_over & (actions & game.INPUT_RESTART != 0)
+        if restart.any():
+            self._new_games(restart)
+        active = ~self.game_over
+        score_before = self.score.copy()
+        self.tick += active
+
+        # Player movement, facing and the shoot cooldown, as in Player.move and Player.shoot
+        speed = self.player_speed
+        dx = ((actions & game.INPUT_RIGHT != 0).astype(np.int64)
+              - (actions & game.INPUT_LEFT != 0)) * speed * active
+        dy = ((actions & game.INPUT_DOWN != 0).astype(np.int64)
+              - (actions & game.INPUT_UP != 0)) * speed * active
+        turn = TURN[3 * np.sign(dx) + np.sign(dy) + 4]
+        np.copyto(self.heading, turn, where=turn >= 0)
+        size = game.PLAYER_SIZE
+        np.clip(self.player_x + dx, size, game.WIDTH - size, out=self.player_x)
+        np.clip(self.player_y + dy, size, game.HEIGHT - size, out=self.player_y)
+        self.cooldown -= active & (self.cooldown > 0)
+        shoot = ((dx != 0) | (dy != 0)) & (self.cooldown <= 0)
+        self.cooldown[shoot] = self.shoot_cooldown
+        self._spawn_shots(shoot)
+
+        # Shots sweep along this tick's move against the comets where they were
+        # at the end of last tick. Finished games have no shots left, so every row moves
+        self._collide_shots()
+        x, y = self.shot_x, self.shot_y
+        x += self.shot_vx
+        y += self.shot_vy
+        self.shot_life -= 1
+        self.shot_alive &= ~((self.shot_life <= 0) | (x < 0) | (x > game.WIDTH) | (y < 0) | (y > game.HEIGHT))
+
+        # Spawning, with the same chances and ranges as World.step
+        chance = self.rng.random((2, self.n))
+        # A row with an empty slot is below its entity cap
+        self._spawn_stars(active & (chance[0] < self.star_spawn_rate) & ~self.star_alive.all(axis=1))
+        self._spawn_obstacles(active & (chance[1] < self.obstacle_spawn_rate)
+                              & ~self.obstacle_alive.all(axis=1))
+
+        # Collect stars the player's body touches. Every coordinate in these rect
+        # tests is a whole number, so an overlap of two boxes is a distance check
+        # between their centers; a finished game's player touches no stars
+        left = np.trunc(self.player_x - PLAYER_BODY_WIDTH // 2)[:, None]
+        top = np.trunc(self.player_y - PLAYER_BODY_TOP)[:, None]
+        body_x, body_y = left + PLAYER_BODY_WIDTH / 2, top + PLAYER_BODY_HEIGHT / 2
+        reach_x, reach_y = (PLAYER_BODY_WIDTH / 2 + game.STAR_SIZE,
+                            PLAYER_BODY_HEIGHT / 2 + game.STAR_SIZE)
+        stars = self.max_stars
+        distance = self._distance[:, :stars]
+        collected = within(self.star_x, body_x, reach_x, self._near_x[:, :stars], distance)
+        collected &= within(self.star_y, body_y, reach_y, self._near_y[:, :stars], distance)
+        collected &= self.star_alive
+        self.score += 10 * collected.sum(axis=1)
+        self.star_alive &= ~collected
+
+        # Move comets, bounce them off the walls, and end games on contact
+        moving = self.obstacle_alive & active[:, None]
+        x, y, vx, vy = self.obstacle_x, self.obstacle_y, self.obstacle_vx, self.obstacle_vy
+        x += vx * moving
+        y += vy * moving
+        size = game.OBSTACLE_SIZE
+        np.negative(vx, out=vx, where=moving & ((x <= size) | (x >= game.WIDTH - size)))
+        np.negative(vy, out=vy, where=moving & ((y <= size) | (y >= game.HEIGHT - size)))
+        np.clip(x, size, game.WIDTH - size, out=x)
+        np.clip(y, size, game.HEIGHT - size, out=y)
+        # The comet's box is truncated like the pygame.Rect constructor does
+        reach_x, reach_y = PLAYER_BODY_WIDTH / 2 + size, PLAYER_BODY_HEIGHT / 2 + size
+        comets = self.max_obstacles
+        distance = self._distance[:, :comets]
+        np.subtract(x, size, out=distance)
+        np.trunc(distance, out=distance)
+        distance += size
+        hit = within(distance, body_x, reach_x, self._near_x[:, :comets], distance)
+        np.subtract(y, size, out=distance)
+        np.trunc(distance, out=distance)
+        distance += size
+        hit &= within(distance, body_y, reach_y, self._near_y[:, :comets], distance)
+        hit &= moving
+        ended = hit.any(axis=1)
+        self.game_over |= ended
+        self.shot_alive[ended] = False  # Restarting clears them anyway
+        np.maximum(self.high_score, self.score, out=self.high_score, where=self.game_over)
+        obs = self.observe() if self.observing else None
+        return obs, self.score - score_before, self.game_over.copy()
+
+    def _spawn_shots(self, shoot):
+        """Fire a shot from the front of each selected player, unless its shot slots are full"""
+        envs = np.flatnonzero(shoot & ~self.shot_alive.all(axis=1))
+        if len(envs) == 0:
+            return
+        slot = free_slots(self.shot_alive, envs)
+        heading = self.heading[envs]
+        cos, sin = HEADING_COS[heading], HEADING_SIN[heading]
+        self.shot_x[envs, slot] = self.player_x[envs] + cos * 20
+        self.shot_y[envs, slot] = self.player_y[envs] + sin * 20
+        self.shot_vx[envs, slot] = game.PROJECTILE_SPEED * cos
+        self.shot_vy[envs, slot] = game.PROJECTILE_SPEED * sin
+        self.shot_life[envs, slot] = game.PROJECTILE_LIFE
+        self.shot_alive[envs, slot] = True
+        self.shot_fired[envs, slot] = self.tick[envs]
+
+    def _collide_shots(self):
+        """Destroy the comets hit by shots this tick and score them, as ProjectileSystem.collide"""
+        # Only pairs within reach of each other over one move can touch, and those are
+        # rare: each live shot is tested against the comet slots of its own game only,
+        # one slot at a time so every gather reads a contiguous column. Flat indices are
+        # taken from the transposed (C-ordered) views, which numpy finds much faster
+        live = np.flatnonzero(self.shot_alive.T)
+        if len(live) == 0:
+            return
+        shot, env = np.divmod(live, self.n)
+        sx, sy = self.shot_x.T.take(live), self.shot_y.T.take(live)
+        near = np.empty((self.max_obstacles, len(live)), dtype=bool)
+        for j in range(self.max_obstacles):
+            np.logical_and(np.abs(sx - self.obstacle_x[:, j].take(env)) <= SHOT_REACH,
+                           np.abs(sy - self.obstacle_y[:, j].take(env)) <= SHOT_REACH, out=near[j])
+            near[j] &= self.obstacle_alive[:, j].take(env)
+        comet, pair = np.divmod(np.flatnonzero(near), len(live))
+        if len(pair) == 0:
+            return
+        env, shot = env[pair], shot[pair]
+        contact = game.swept_contact(self.shot_x[env, shot, None], self.shot_y[env, shot, None],
+                                     self.shot_vx[env, shot, None], self.shot_vy[env, shot, None],
+                                     np.full((len(env), 1), float(game.PROJECTILE_SIZE)),
+                                     self.obstacle_x[env, comet, None], self.obstacle_y[env, comet, None],
+                                     self.obstacle_radius[env, comet, None])[:, 0, 0]
+        touching = contact <= 1
+        env, shot, comet, contact = env[touching], shot[touching], comet[touching], contact[touching]
+        # Shots in firing order each take the first comet along their path that
+        # an earlier shot hasn't already taken; ties go to the older comet
+        order = np.lexsort((self.obstacle_spawned[env, comet], contact, self.shot_fired[env, shot], env))
+        taken = set()
+        fired = set()
+        for e, i, j in zip(env[order].tolist(), shot[order].tolist(), comet[order].tolist()):
+            if (e, i) in fired or (e, j) in taken:
+                continue
+            fired.add((e, i))
+            taken.add((e, j))
+            self.shot_alive[e, i] = False
+            self.obstacle_alive[e, j] = False
+            self.score[e] += 5
+
+    def _spawn_stars(self, spawn):
+        envs = np.flatnonzero(spawn)
+        if len(envs) == 0:
+            return
+        slot = free_slots(self.star_alive, envs)
+        k = len(envs)
+        self.star_x[envs, slot] = self.rng.integers(game.STAR_SIZE, game.WIDTH - game.STAR_SIZE + 1, k)
+        self.star_y[envs, slot] = self.rng.integers(game.STAR_SIZE, game.HEIGHT - game.STAR_SIZE + 1, k)
+        self.star_alive[envs, slot] = True
+
+    def _spawn_obstacles(self, spawn):
+        envs = np.flatnonzero(spawn)
+        if len(envs) == 0:
+            return
+        slot = free_slots(self.obstacle_alive, envs)
+        k = len(envs)
+        rng = self.rng
+        size = game.OBSTACLE_SIZE
+        speed = rng.uniform(1, MAX_OBSTACLE_SPEED, k)
+        angle = rng.uniform(0, 2 * np.pi, k)
+        self.obstacle_x[envs, slot] = rng.integers(size, game.WIDTH - size + 1, k)
+        self.obstacle_y[envs, slot] = rng.integers(size, game.HEIGHT - size + 1, k)
+        # Only a few comets spawn per tick, so use math's cos/sin like World.spawn_obstacle for identical velocities
+        self.obstacle_vx[envs, slot] = [v * math.cos(a) for v, a in zip(speed.tolist(), angle.tolist())]
+        self.obstacle_vy[envs, slot] = [v * math.sin(a) for v, a in zip(speed.tolist(), angle.tolist())]
+        # The circle that best fits an outline of COMET_POINTS radii, as in CometShape._generate_shape.
+        # Summing down the first axis adds the radii one at a time, like sum() does
+        variation = rng.uniform(0.90, 1.0, (game.COMET_POINTS, k))
+        self.obstacle_radius[envs, slot] = size * variation.sum(axis=0) / game.COMET_POINTS
+        self.obstacle_alive[envs, slot] = True
+        self.obstacle_spawned[envs, slot] = self.tick[envs]
+
+    def observe(self):
+        """Return the (N, obs_size) float32 observation of every game, in the reused buffer"""
+        obs = self._obs
+        np.multiply(self.player_x, 1 / game.WIDTH, out=obs[:, 0], casting="unsafe")
+        np.multiply(self.player_y, 1 / game.HEIGHT, out=obs[:, 1], casting="unsafe")
+        np.take(HEADING_COS, self.heading, out=obs[:, 2], mode="clip")
+        np.take(HEADING_SIN, self.heading, out=obs[:, 3], mode="clip")
+        np.multiply(self.cooldown, 1 / max(self.shoot_cooldown, 1), out=obs[:, 4], casting="unsafe")
+        for columns, values, offset, scale, alive in self._features:
+            if alive is None:
+                np.copyto(columns, values)
+                continue
+            np.subtract(values, offset, out=columns, casting="unsafe")
+            columns *= scale
+            columns *= alive
+        return obs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batched environment throughput")
+    parser.add_argument("--envs", type=int, default=4096, help="games stepped together")
+    parser.add_argument("--ticks", type=int, default=1000, help="steps to time")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-observe", action="store_true",
+                        help="skip building observations, for policies that read the state arrays")
+    args = parser.parse_args(argv)
+
+    env = VecEnv(args.envs, seed=args.seed, observe=not args.no_observe)
+    policy_rng = np.random.default_rng(args.seed ^ 0x5EED)
+    actions = policy_rng.integers(0, 16, args.envs)
+    dones = env.game_over
+    games = 0
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        # Random inputs held for a while, like selfplay's random policy, restarting finished games
+        change = policy_rng.random(args.envs) < 0.05
+        actions[change] = policy_rng.integers(0, 16, int(change.sum()))
+        _, _, dones = env.step(actions | dones * game.INPUT_RESTART)
+        games += int(dones.sum())
+    elapsed = time.perf_counter() - start
+    steps = args.envs * args.ticks
+    print(f"{args.envs} envs x {args.ticks} ticks in {elapsed:.2f}s: "
+          f"{steps / max(elapsed, 1e-9):,.0f} agent-steps/s, {games} games ended")
+
+if __name__ == "__main__":
+    main()